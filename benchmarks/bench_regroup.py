@@ -0,0 +1,174 @@
+"""
+Benchmark ScaffoldGroupManager on synthetic scaffolds.
+
+Each case runs in a fresh process so peak RSS is per case, and is repeated
+keeping the fastest time of each phase and the lowest peak RSS. Results are
+compared against a stored baseline, and the exit status is non-zero if any phase
+is slower than the baseline by more than the tolerance and by more than a
+minimum time, below which timings are noise, or if the peak RSS grew by more
+than the memory tolerance. All sizes run by default: the phases of the small
+cases are mostly under the minimum time, so only the large cases catch a
+slowdown of them. Runs offline and without a display.
+
+The committed baseline.json is a reference from one machine. Store a baseline
+of your own with --save-baseline before comparing on other hardware.
+
+Usage:
+    python benchmarks/bench_regroup.py                      # run and compare with baseline.json
+    python benchmarks/bench_regroup.py --save-baseline      # run and store results as the baseline
+    python benchmarks/bench_regroup.py --sizes small medium --output results.json
+    python benchmarks/bench_regroup.py --repeat 5 --save-baseline
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+# name: (elements around, elements up, elements through wall)
+SIZES = {
+    'small': (8, 4, 1),
+    'medium': (32, 16, 2),
+    'large': (96, 48, 4),
+}
+GROUP_COUNTS = [4, 16, 48]
+# The incremental phases are the manage_groups of a first apply writing a state file and of a
+# second apply reusing every rule set from it.
+COMPARED_PHASES = ['load', 'manage_groups', 'save', 'incremental_apply', 'incremental_reapply']
+# Slowdowns of less than this many seconds are not regressions.
+DEFAULT_MIN_TIME = 0.01
+DEFAULT_MEMORY_TOLERANCE = 0.1
+
+
+def run_case(size_name, group_count):
+    from synthetic import write_tube_scaffold
+    from mapclientplugins.scaffoldgroupmanagerstep.incremental import STATE_FILE_NAME
+    from mapclientplugins.scaffoldgroupmanagerstep.scaffoldgroupmanager import ScaffoldGroupManager
+
+    with tempfile.TemporaryDirectory() as directory:
+        scaffold_file = os.path.join(directory, 'tube.exf')
+        groups = write_tube_scaffold(scaffold_file, *SIZES[size_name], group_count)
+        manager = ScaffoldGroupManager(scaffold_file, groups)
+        manager.load()
+        manager.apply()
+        manager.save()
+        report = manager.get_report()
+        result = {
+            'phases': {phase: report.get_phase_time(phase)
+                       for phase in ['load', 'manage_groups', 'save', 'classify_faces']},
+            'faces_removed': sum(report.removed_counts.values()),
+            'peak_rss': report.peak_rss,
+            'input_size': os.path.getsize(scaffold_file),
+            'output_size': os.path.getsize(manager.get_output_file_name()),
+        }
+        manager = ScaffoldGroupManager(scaffold_file, groups, state_file=os.path.join(directory, STATE_FILE_NAME))
+        for phase in ['incremental_apply', 'incremental_reapply']:
+            manager.apply()
+            result['phases'][phase] = manager.get_report().get_phase_time('manage_groups')
+        return result
+
+
+def case_name(size_name, group_count):
+    return '{0}-{1}groups'.format(size_name, group_count)
+
+
+def run_benchmarks(size_names, group_counts, repeat=1):
+    results = {}
+    for size_name in size_names:
+        for group_count in group_counts:
+            result = None
+            for _ in range(repeat):
+                # A new process per run so peak RSS and Zinc state do not carry over.
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    run_result = executor.submit(run_case, size_name, group_count).result()
+                if result is None:
+                    result = run_result
+                else:
+                    for phase, time in run_result['phases'].items():
+                        result['phases'][phase] = min(result['phases'][phase], time)
+                    if run_result['peak_rss']:
+                        result['peak_rss'] = min(result['peak_rss'] or run_result['peak_rss'], run_result['peak_rss'])
+            name = case_name(size_name, group_count)
+            results[name] = result
+            print('{0:20s} '.format(name) + '  '.join(
+                '{0} {1:.3f}s'.format(phase, result['phases'][phase]) for phase in COMPARED_PHASES) +
+                ('  peak RSS {0:.1f} MB'.format(result['peak_rss'] / 1024 ** 2) if result['peak_rss'] else ''))
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance, min_time=DEFAULT_MIN_TIME,
+                          memory_tolerance=DEFAULT_MEMORY_TOLERANCE):
+    """
+    Return a list of messages for phases slower than baseline by more than
+    tolerance and by more than min_time seconds, and for peak RSS larger than
+    baseline by more than memory_tolerance.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for phase in COMPARED_PHASES:
+            if phase not in baseline[name]['phases']:
+                continue
+            baseline_time = baseline[name]['phases'][phase]
+            time = result['phases'][phase]
+            if (time > baseline_time * (1.0 + tolerance)) and (time - baseline_time > min_time):
+                regressions.append('{0} {1}: {2:.3f}s vs baseline {3:.3f}s'.format(name, phase, time, baseline_time))
+        baseline_peak_rss = baseline[name].get('peak_rss')
+        peak_rss = result['peak_rss']
+        if baseline_peak_rss and peak_rss and (peak_rss > baseline_peak_rss * (1.0 + memory_tolerance)):
+            regressions.append('{0} peak RSS: {1:.1f} MB vs baseline {2:.1f} MB'.format(
+                name, peak_rss / 1024 ** 2, baseline_peak_rss / 1024 ** 2))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the scaffold group manager on synthetic scaffolds.')
+    parser.add_argument('--sizes', nargs='+', choices=sorted(SIZES), default=list(SIZES))
+    parser.add_argument('--groups', nargs='+', type=int, default=GROUP_COUNTS)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline results json file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed fractional slowdown')
+    parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME,
+                        help='slowdowns of fewer seconds than this are not regressions')
+    parser.add_argument('--memory-tolerance', type=float, default=DEFAULT_MEMORY_TOLERANCE,
+                        help='allowed fractional growth of peak RSS')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each case, keeping the fastest phase times')
+    parser.add_argument('--output', help='write the results to this json file')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.groups, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(results, indent=4))
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline, "r") as f:
+                baseline = json.loads(f.read())
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            f.write(json.dumps(baseline, indent=4, sort_keys=True))
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print('No baseline at', args.baseline, '- run with --save-baseline to create one')
+        return 0
+    with open(args.baseline, "r") as f:
+        baseline = json.loads(f.read())
+    regressions = compare_with_baseline(results, baseline, args.tolerance, args.min_time, args.memory_tolerance)
+    for regression in regressions:
+        print('Regression:', regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
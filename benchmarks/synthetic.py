@@ -0,0 +1,112 @@
+"""
+Synthetic scaffolds for benchmarking.
+
+The scaffold is a tube-shaped wall of trilinear hexahedra, similar to a heart
+chamber wall: xi1 goes around, xi2 goes up and xi3 goes through the wall, so the
+xi3 = 0 and xi3 = 1 exterior faces are the inner and outer surfaces. The wall is
+split around its circumference into term groups. Each group holds its elements
+and all of their faces, lines and nodes, like the face groups of the heart scaffold.
+"""
+import math
+
+from opencmiss.zinc.context import Context
+from opencmiss.zinc.element import Element, Elementbasis
+from opencmiss.zinc.field import Field, FieldGroup
+from opencmiss.utils.zinc.general import ChangeManager
+
+
+def _create_coordinates(field_module):
+    coordinates = field_module.createFieldFiniteElement(3)
+    coordinates.setName('coordinates')
+    coordinates.setManaged(True)
+    coordinates.setTypeCoordinate(True)
+    coordinates.setCoordinateSystemType(Field.COORDINATE_SYSTEM_TYPE_RECTANGULAR_CARTESIAN)
+    for c, name in enumerate(['x', 'y', 'z']):
+        coordinates.setComponentName(c + 1, name)
+    return coordinates
+
+
+def create_tube_scaffold(region, elements_around, elements_up, elements_through_wall, group_count,
+                         inner_radius=1.0, wall_thickness=0.2, height=2.0):
+    """
+    Create a tube wall scaffold in region.
+
+    :return: List of the term group names.
+    """
+    field_module = region.getFieldmodule()
+    nodes_up = elements_up + 1
+    nodes_through_wall = elements_through_wall + 1
+
+    def node_identifier(i, j, k):
+        return 1 + (i % elements_around) + elements_around * (j + nodes_up * k)
+
+    with ChangeManager(field_module):
+        coordinates = _create_coordinates(field_module)
+        nodes = field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES)
+        node_template = nodes.createNodetemplate()
+        node_template.defineField(coordinates)
+        field_cache = field_module.createFieldcache()
+        for k in range(nodes_through_wall):
+            radius = inner_radius + wall_thickness * k / elements_through_wall
+            for j in range(nodes_up):
+                z = height * j / elements_up
+                for i in range(elements_around):
+                    theta = 2.0 * math.pi * i / elements_around
+                    node = nodes.createNode(node_identifier(i, j, k), node_template)
+                    field_cache.setNode(node)
+                    coordinates.assignReal(field_cache, [radius * math.cos(theta), radius * math.sin(theta), z])
+
+        mesh = field_module.findMeshByDimension(3)
+        basis = field_module.createElementbasis(3, Elementbasis.FUNCTION_TYPE_LINEAR_LAGRANGE)
+        eft = mesh.createElementfieldtemplate(basis)
+        element_template = mesh.createElementtemplate()
+        element_template.setElementShapeType(Element.SHAPE_TYPE_CUBE)
+        element_template.defineField(coordinates, -1, eft)
+        elements_by_group = [[] for _ in range(group_count)]
+        element_identifier = 1
+        for k in range(elements_through_wall):
+            for j in range(elements_up):
+                for i in range(elements_around):
+                    element = mesh.createElement(element_identifier, element_template)
+                    element.setNodesByIdentifier(eft, [
+                        node_identifier(i, j, k), node_identifier(i + 1, j, k),
+                        node_identifier(i, j + 1, k), node_identifier(i + 1, j + 1, k),
+                        node_identifier(i, j, k + 1), node_identifier(i + 1, j, k + 1),
+                        node_identifier(i, j + 1, k + 1), node_identifier(i + 1, j + 1, k + 1)])
+                    elements_by_group[i * group_count // elements_around].append(element)
+                    element_identifier += 1
+        field_module.defineAllFaces()
+
+        group_names = []
+        for g, elements in enumerate(elements_by_group):
+            if not elements:
+                continue
+            group_name = 'term {0}'.format(g + 1)
+            group = field_module.createFieldGroup()
+            group.setName(group_name)
+            group.setManaged(True)
+            group.setSubelementHandlingMode(FieldGroup.SUBELEMENT_HANDLING_MODE_FULL)
+            mesh_group = group.createFieldElementGroup(mesh).getMeshGroup()
+            for element in elements:
+                mesh_group.addElement(element)
+            group_names.append(group_name)
+    return group_names
+
+
+def make_group_rules(group_names):
+    """
+    Make rules cycling through the inner, outer and inner-and-outer surfaces.
+    """
+    surfaces = ['inner', 'outer', 'inner,outer']
+    return [group_name + ',' + surfaces[g % len(surfaces)] for g, group_name in enumerate(group_names)]
+
+
+def write_tube_scaffold(file_name, elements_around, elements_up, elements_through_wall, group_count):
+    """
+    Write a synthetic tube scaffold to file_name and return its groups config dict.
+    """
+    context = Context('SyntheticScaffold')
+    region = context.getDefaultRegion()
+    group_names = create_tube_scaffold(region, elements_around, elements_up, elements_through_wall, group_count)
+    region.writeFile(file_name)
+    return {'groups': make_group_rules(group_names)}
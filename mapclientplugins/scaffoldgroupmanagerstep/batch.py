@@ -0,0 +1,128 @@
+"""
+Regroup many scaffold files against one groups config, fanned out across a
+process pool.  Each worker process builds its own Zinc context.
+
+Usage:
+    python -m mapclientplugins.scaffoldgroupmanagerstep.batch groups.config "fits/*.exf"
+"""
+import sys
+import glob
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+class BatchResult(object):
+
+    def __init__(self, input_file, output_file=None, elapsed=0.0, error=None):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.elapsed = elapsed
+        self.error = error
+
+    def succeeded(self):
+        return self.error is None
+
+    def to_dict(self):
+        return {
+            'input_file': self.input_file,
+            'output_file': self.output_file,
+            'elapsed': self.elapsed,
+            'error': self.error,
+        }
+
+
+def expand_scaffold_files(patterns):
+    """
+    Expand a list of file names and glob patterns into a sorted list of unique files.
+    """
+    files = []
+    for pattern in patterns:
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            if match not in files:
+                files.append(match)
+    return sorted(files)
+
+
+def load_groups(groups_config_file):
+    with open(groups_config_file, "r") as f:
+        return json.loads(f.read())
+
+
+def _regroup_one(input_file, groups, options):
+    # Imported here so the worker process pays the Zinc import, not the caller.
+    from mapclientplugins.scaffoldgroupmanagerstep.scaffoldgroupmanager import regroup_scaffold
+
+    start = time.perf_counter()
+    try:
+        manager = regroup_scaffold(input_file, groups, **options)
+        return BatchResult(input_file, manager.get_output_file_name(), time.perf_counter() - start)
+    except Exception:
+        return BatchResult(input_file, elapsed=time.perf_counter() - start, error=traceback.format_exc())
+
+
+def regroup_files(scaffold_files, groups, max_workers=None, callback=None, options=None):
+    """
+    Regroup each of scaffold_files with groups in a pool of worker processes.
+    A failure in one file is recorded in its result and does not stop the batch.
+
+    :param scaffold_files: List of file names or glob patterns.
+    :param groups: Groups config dict, as read from groups.config.
+    :param max_workers: Number of worker processes, defaults to the CPU count.
+    :param callback: Optional callable invoked with each BatchResult as it completes.
+    :param options: Optional dict of keyword arguments for ScaffoldGroupManager.
+    :return: List of BatchResult in the order of the expanded input files.
+    """
+    input_files = expand_scaffold_files(scaffold_files)
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_regroup_one, input_file, groups, options or {}): input_file
+                   for input_file in input_files}
+        for future in as_completed(futures):
+            input_file = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                # The worker process itself died, e.g. a crash inside Zinc.
+                result = BatchResult(input_file, error=traceback.format_exc())
+            results[input_file] = result
+            if callback:
+                callback(result)
+    return [results[input_file] for input_file in input_files]
+
+
+def print_result(result):
+    if result.succeeded():
+        print('{0:8.2f}s  OK    {1} -> {2}'.format(result.elapsed, result.input_file, result.output_file))
+    else:
+        print('{0:8.2f}s  FAIL  {1}'.format(result.elapsed, result.input_file))
+        print(result.error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Regroup scaffold files with a groups config.')
+    parser.add_argument('groups_config', help='groups.config file with the group rules')
+    parser.add_argument('scaffold_files', nargs='+', help='scaffold files or glob patterns')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--report', help='write per-file timings and failures to this json file')
+    args = parser.parse_args(argv)
+
+    groups = load_groups(args.groups_config)
+    start = time.perf_counter()
+    results = regroup_files(args.scaffold_files, groups, max_workers=args.jobs, callback=print_result)
+    failed = [result for result in results if not result.succeeded()]
+    print('Regrouped {0} of {1} files in {2:.2f}s'.format(
+        len(results) - len(failed), len(results), time.perf_counter() - start))
+
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(json.dumps([result.to_dict() for result in results], indent=4))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
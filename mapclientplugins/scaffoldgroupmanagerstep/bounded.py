@@ -0,0 +1,71 @@
+"""
+Planning for the chunked regroup of scaffolds whose groups are too large to hold
+in one region.
+
+The rules are split into chunks whose groups, together with the mesh and the
+coordinates field needed to classify faces, fit an estimated memory budget.
+Each chunk is read and trimmed in its own region, and the output is written by
+streaming the input file, so the groups of the whole scaffold are never held
+in memory at once.
+
+Only the groups are split. Every chunk reads all of the nodes, elements and
+faces (and lines where needed) and the coordinates field again, so no chunk
+needs less memory than that mesh, and the mesh is read once per chunk. The
+budget is an estimate used to size the chunks, checked against the growth of
+the process only after each chunk has run; it is not a bound on memory. Rules
+scoped to regions other than the root are not supported, as the streamed output
+copies the groups of subregions unchanged.
+"""
+from mapclientplugins.scaffoldgroupmanagerstep.preflight import BYTES_PER_NODE, BYTES_PER_ELEMENT, \
+    BYTES_PER_PARAMETER
+
+# Rough in-memory cost of one member of a Zinc group.
+BYTES_PER_GROUP_MEMBER = 16
+COORDINATE_COMPONENTS = 3
+
+
+def get_mesh_memory_estimate(header, with_lines=False):
+    """
+    Estimate the memory of the nodes, elements and coordinates read for each chunk.
+    """
+    element_count = header.element_counts[3] + header.element_counts[2] + \
+        (header.element_counts[1] if with_lines else 0)
+    return header.node_count * (BYTES_PER_NODE + COORDINATE_COMPONENTS * BYTES_PER_PARAMETER) + \
+        element_count * BYTES_PER_ELEMENT
+
+
+def get_group_memory_estimate(header, group_name):
+    return BYTES_PER_GROUP_MEMBER * sum(size for (name, dimension), size in header.group_sizes.items()
+                                        if name == group_name)
+
+
+def plan_chunks(plan, header, memory_budget, with_lines=False):
+    """
+    Pack the rules of plan into chunks estimated to fit memory_budget bytes.
+
+    :param with_lines: Set if each chunk reads mesh1d to rebuild the lines of
+    its groups, which is also read if any rule trims lines.
+    :return: List of lists of GroupRule, one per chunk.
+    """
+    mesh_memory = get_mesh_memory_estimate(header, with_lines or any(rule.dimension == 1 for rule in plan.rules))
+    if mesh_memory > memory_budget:
+        raise MemoryError('The mesh of {0} needs an estimated {1:.1f} MB, over the budget of {2:.1f} MB'.format(
+            header.file_name, mesh_memory / 1024 ** 2, memory_budget / 1024 ** 2))
+    chunks = []
+    chunk_memory = None
+    for rules in plan.get_rule_sets():
+        group_names = set(name for rule in rules
+                          for name in [rule.group_name] + (rule.condition.get_group_names() if rule.condition else []))
+        rules_memory = sum(get_group_memory_estimate(header, name) for name in group_names)
+        if mesh_memory + rules_memory > memory_budget:
+            raise MemoryError('The groups {0} need an estimated {1:.1f} MB with the mesh, over the budget of '
+                              '{2:.1f} MB'.format(', '.join(sorted(group_names)),
+                                                  (mesh_memory + rules_memory) / 1024 ** 2,
+                                                  memory_budget / 1024 ** 2))
+        if chunks and (chunk_memory + rules_memory <= memory_budget):
+            chunks[-1].extend(rules)
+            chunk_memory += rules_memory
+        else:
+            chunks.append(list(rules))
+            chunk_memory = mesh_memory + rules_memory
+    return chunks
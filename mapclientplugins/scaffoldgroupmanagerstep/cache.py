@@ -0,0 +1,181 @@
+"""
+Content-addressed cache of regrouped scaffold outputs.
+
+Entries are keyed on the input scaffold contents, the normalised group rules and
+the plugin version, so a re-run with an unchanged scaffold and groups.config can
+return the previously written output without loading anything into Zinc.
+"""
+import os
+import json
+import shutil
+import hashlib
+
+from mapclientplugins.scaffoldgroupmanagerstep.rules import split_terms
+
+HASH_CHUNK_SIZE = 1 << 20
+DEFAULT_CACHE_SIZE_LIMIT = 2 * 1024 ** 3  # bytes
+
+
+def normalise_groups(groups):
+    """
+    Return the group rules in a canonical form: blank lines dropped, whitespace
+    around each term removed. Terms are split as the rules are parsed, so commas
+    inside quoted group names or parentheses are kept.
+    """
+    group_item_list = groups.get("groups", []) if groups else []
+    normalised = []
+    for group_item in group_item_list:
+        terms = split_terms(group_item)
+        if terms and terms[0]:
+            normalised.append(','.join(terms))
+    return normalised
+
+
+def hash_file(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        chunk = f.read(HASH_CHUNK_SIZE)
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(HASH_CHUNK_SIZE)
+    return digest.hexdigest()
+
+
+def compute_key(input_scaffold_file, groups, version, options=None, input_file=None):
+    """
+    Compute the cache key for regrouping input_scaffold_file with groups.
+
+    :param options: Optional dict of output affecting settings, included in the key.
+    :param input_file: Optional open MappedInputFile of input_scaffold_file, hashed
+    from its mapping instead of reading the file.
+    """
+    digest = hashlib.sha256()
+    digest.update((input_file.get_hexdigest() if input_file else hash_file(input_scaffold_file)).encode())
+    digest.update(json.dumps(normalise_groups(groups)).encode())
+    digest.update(str(version).encode())
+    if options:
+        digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class OutputCache(object):
+    """
+    Directory of cached outputs with a json index, evicted least recently used
+    first once the total size exceeds size_limit.
+    """
+
+    INDEX_FILE_NAME = 'index.json'
+
+    def __init__(self, directory, size_limit=DEFAULT_CACHE_SIZE_LIMIT):
+        self._directory = directory
+        self._size_limit = size_limit
+        self._index_file = os.path.join(directory, self.INDEX_FILE_NAME)
+        self._index = {}
+        self._counter = 0
+        self._load_index()
+
+    def _load_index(self):
+        if os.path.isfile(self._index_file):
+            try:
+                with open(self._index_file, "r") as f:
+                    self._index = json.loads(f.read())
+            except (OSError, ValueError):
+                self._index = {}
+        # Drop entries written by an older index layout.
+        self._index = {key: entry for key, entry in self._index.items() if isinstance(entry.get('files'), dict)}
+        self._counter = max([entry['last_used'] for entry in self._index.values()], default=0)
+
+    def _save_index(self):
+        os.makedirs(self._directory, exist_ok=True)
+        with open(self._index_file, "w") as f:
+            f.write(json.dumps(self._index, sort_keys=True, indent=4))
+
+    def _next_counter(self):
+        self._counter += 1
+        return self._counter
+
+    def _entry_paths(self, key):
+        return [os.path.join(self._directory, entry_file['file_name'])
+                for entry_file in self._index[key]['files'].values()]
+
+    def lookup(self, key):
+        """
+        Return a dict of output paths by role for key, or None on a miss.  The originally
+        written outputs are returned if all are untouched since they were cached,
+        otherwise the cached copies are, so outputs naming each other stay consistent.
+        """
+        if key not in self._index:
+            return None
+        entry = self._index[key]
+        paths = self._entry_paths(key)
+        if not all(os.path.isfile(path) for path in paths):
+            del self._index[key]
+            self._save_index()
+            return None
+        entry['last_used'] = self._next_counter()
+        self._save_index()
+        originals_untouched = True
+        for entry_file in entry['files'].values():
+            output_file = entry_file['output_file']
+            stat = os.stat(output_file) if os.path.isfile(output_file) else None
+            if not (stat and (stat.st_size == entry_file['size']) and (stat.st_mtime_ns == entry_file['output_mtime'])):
+                originals_untouched = False
+        return {role: entry_file['output_file'] if originals_untouched else path
+                for (role, entry_file), path in zip(entry['files'].items(), paths)}
+
+    def store(self, key, output_files):
+        """
+        Copy output_files, a dict of file names by role, into the cache under key
+        and return the cached paths by role.  Each entry is a directory keeping the
+        original file names, so relative references between the outputs still hold.
+        """
+        os.makedirs(os.path.join(self._directory, key), exist_ok=True)
+        entry_files = {}
+        paths = {}
+        for role, output_file in output_files.items():
+            file_name = os.path.join(key, os.path.basename(output_file))
+            path = os.path.join(self._directory, file_name)
+            shutil.copyfile(output_file, path)
+            stat = os.stat(output_file)
+            entry_files[role] = {
+                'file_name': file_name,
+                'size': stat.st_size,
+                'output_file': os.path.abspath(output_file),
+                'output_mtime': stat.st_mtime_ns,
+            }
+            paths[role] = path
+        self._index[key] = {
+            'files': entry_files,
+            'size': sum(entry_file['size'] for entry_file in entry_files.values()),
+            'last_used': self._next_counter(),
+        }
+        self._evict()
+        self._save_index()
+        return paths
+
+    def size(self):
+        return sum(entry['size'] for entry in self._index.values())
+
+    def _evict(self):
+        keys = sorted(self._index, key=lambda k: self._index[k]['last_used'])
+        total = self.size()
+        for key in keys[:-1]:  # Always keep the newest entry.
+            if total <= self._size_limit:
+                break
+            total -= self._index[key]['size']
+            self._remove_entry_files(key)
+            del self._index[key]
+
+    def _remove_entry_files(self, key):
+        for path in self._entry_paths(key):
+            if os.path.isfile(path):
+                os.remove(path)
+        entry_directory = os.path.join(self._directory, key)
+        if os.path.isdir(entry_directory) and not os.listdir(entry_directory):
+            os.rmdir(entry_directory)
+
+    def clear(self):
+        for key in list(self._index):
+            self._remove_entry_files(key)
+        self._index = {}
+        self._save_index()
@@ -0,0 +1,197 @@
+"""
+Single pass face classification.
+
+Each face (or line) of a mesh is classified once as exterior and by which face
+of its parent it lies on, e.g. xi3 = 0 (inner) or xi3 = 1 (outer).  Each flag is
+kept as a temporary Zinc group of the faces having it, filled by one conditional
+pass over the mesh.  Group rules are then conditions on these flag groups, so
+each group is trimmed in bulk by removeElementsConditional with a group lookup
+per member, rather than evaluating the exterior and face fields per face per group.
+"""
+from opencmiss.zinc.element import Element
+from opencmiss.utils.zinc.general import ChangeManager
+
+FACE_EXTERIOR = 1
+FACE_TYPE_FLAGS = {
+    Element.FACE_TYPE_XI1_0: 2,
+    Element.FACE_TYPE_XI1_1: 4,
+    Element.FACE_TYPE_XI2_0: 8,
+    Element.FACE_TYPE_XI2_1: 16,
+    Element.FACE_TYPE_XI3_0: 32,
+    Element.FACE_TYPE_XI3_1: 64,
+}
+ALL_FLAGS = FACE_EXTERIOR | sum(FACE_TYPE_FLAGS.values())
+
+
+def iterate_elements(mesh):
+    element_iterator = mesh.createElementiterator()
+    element = element_iterator.next()
+    while element.isValid():
+        yield element
+        element = element_iterator.next()
+
+
+def iterate_nodes(nodeset):
+    node_iterator = nodeset.createNodeiterator()
+    node = node_iterator.next()
+    while node.isValid():
+        yield node
+        node = node_iterator.next()
+
+
+class FaceClassification(object):
+    """
+    Temporary Zinc groups of the faces of mesh having each classification flag.
+    The groups are unnamed and released with the classification, so they are
+    never written with the region.
+    """
+
+    def __init__(self, field_module, mesh):
+        self._field_module = field_module
+        self._mesh = mesh
+        self._flag_groups = {}
+        self.computed_flags = 0
+
+    def get_flag_group(self, flag):
+        """
+        :return: FieldGroup of the faces with flag, which must have been computed.
+        """
+        return self._flag_groups[flag]
+
+    def iterate_flag_identifiers(self, flag):
+        mesh_group = self._flag_groups[flag].getFieldElementGroup(self._mesh).getMeshGroup()
+        for element in iterate_elements(mesh_group):
+            yield element.getIdentifier()
+
+    def to_array(self):
+        """
+        Get the classified faces as a NumPy structured array with fields identifier,
+        flags, exterior, inner and outer, built from the identifiers of each flag
+        group. Only faces of a parent element, which have a face type flag, are
+        included.
+
+        The flags are combined with NumPy, but the identifiers of each flag group
+        are read with a Zinc element iterator, one Python call per face, as the
+        Zinc Python bindings have no bulk export of a mesh group's identifiers.
+        """
+        import numpy as np
+
+        flag_identifiers = {flag: np.fromiter(self.iterate_flag_identifiers(flag), dtype=np.int32)
+                            for flag in self._flag_groups}
+        size = max((int(identifiers.max()) + 1 for identifiers in flag_identifiers.values() if len(identifiers)),
+                   default=0)
+        flags = np.zeros(size, dtype=np.uint8)
+        for flag, identifiers in flag_identifiers.items():
+            flags[identifiers] |= flag
+        face_type_mask = sum(FACE_TYPE_FLAGS.values())
+        identifiers = np.flatnonzero(flags & face_type_mask)
+        face_flags = flags[identifiers]
+        exterior = (face_flags & FACE_EXTERIOR) != 0
+        faces = np.zeros(len(identifiers), dtype=[('identifier', np.int32), ('flags', np.uint8),
+                                                  ('exterior', np.bool_), ('inner', np.bool_), ('outer', np.bool_)])
+        faces['identifier'] = identifiers
+        faces['flags'] = face_flags
+        faces['exterior'] = exterior
+        faces['inner'] = exterior & ((face_flags & FACE_TYPE_FLAGS[Element.FACE_TYPE_XI3_0]) != 0)
+        faces['outer'] = exterior & ((face_flags & FACE_TYPE_FLAGS[Element.FACE_TYPE_XI3_1]) != 0)
+        return faces
+
+    def add_flags(self, flags):
+        """
+        Classify all elements of mesh for those of flags not yet computed, with
+        one conditional pass per flag, each evaluated inside Zinc.
+        """
+        flags &= ~self.computed_flags
+        if not flags:
+            return
+        field_module = self._field_module
+        with ChangeManager(field_module):
+            flag_conditions = []
+            if flags & FACE_EXTERIOR:
+                flag_conditions.append((FACE_EXTERIOR, field_module.createFieldIsExterior()))
+            for face_type, flag in FACE_TYPE_FLAGS.items():
+                if flags & flag:
+                    flag_conditions.append((flag, field_module.createFieldIsOnFace(face_type)))
+            for flag, condition in flag_conditions:
+                group = field_module.createFieldGroup()
+                group.createFieldElementGroup(self._mesh).getMeshGroup().addElementsConditional(condition)
+                self._flag_groups[flag] = group
+            del flag_conditions
+        self.computed_flags |= flags
+
+    @classmethod
+    def from_mesh(cls, field_module, mesh, flags=ALL_FLAGS):
+        classification = cls(field_module, mesh)
+        classification.add_flags(flags)
+        return classification
+
+
+def remove_faces(field_module, mesh_group, identifiers):
+    """
+    Remove the elements with identifiers from mesh_group. They are gathered in a
+    temporary group and removed from mesh_group in one bulk pass inside Zinc.
+    """
+    mesh = mesh_group.getMasterMesh()
+    with ChangeManager(field_module):
+        removed_group = field_module.createFieldGroup()
+        removed_mesh_group = removed_group.createFieldElementGroup(mesh).getMeshGroup()
+        for identifier in identifiers:
+            removed_mesh_group.addElement(mesh.findElementByIdentifier(identifier))
+        mesh_group.removeElementsConditional(removed_group)
+        del removed_mesh_group
+        del removed_group
+
+
+def remove_nodes(field_module, nodeset_group, identifiers):
+    """
+    Remove the nodes with identifiers from nodeset_group in bulk, as remove_faces.
+    """
+    nodes = nodeset_group.getMasterNodeset()
+    with ChangeManager(field_module):
+        removed_group = field_module.createFieldGroup()
+        removed_nodeset_group = removed_group.createFieldNodeGroup(nodes).getNodesetGroup()
+        for identifier in identifiers:
+            removed_nodeset_group.addNode(nodes.findNodeByIdentifier(identifier))
+        nodeset_group.removeNodesConditional(removed_group)
+        del removed_nodeset_group
+        del removed_group
+
+
+def remove_unmatched_elements(field_module, group, mesh_group, removal_condition):
+    """
+    Remove the elements of mesh_group, the mesh group of group, satisfying
+    removal_condition, in bulk inside Zinc. The group is first copied into a
+    temporary group, so only its members are visited, and the removed elements
+    are those left in the copy but no longer in the group.
+
+    :return: List of identifiers of the elements removed.
+    """
+    with ChangeManager(field_module):
+        removed_group = field_module.createFieldGroup()
+        removed_mesh_group = removed_group.createFieldElementGroup(mesh_group.getMasterMesh()).getMeshGroup()
+        removed_mesh_group.addElementsConditional(group)
+        mesh_group.removeElementsConditional(removal_condition)
+        removed_mesh_group.removeElementsConditional(group)
+        removed = [element.getIdentifier() for element in iterate_elements(removed_mesh_group)]
+        del removed_mesh_group
+        del removed_group
+    return removed
+
+
+def remove_unmatched_nodes(field_module, group, nodeset_group, removal_condition):
+    """
+    Remove the nodes of nodeset_group, the nodeset group of group, satisfying
+    removal_condition, in bulk inside Zinc as remove_unmatched_elements.
+
+    :return: List of identifiers of the nodes removed.
+    """
+    with ChangeManager(field_module):
+        removed_group = field_module.createFieldGroup()
+        removed_nodeset_group = removed_group.createFieldNodeGroup(nodeset_group.getMasterNodeset()).getNodesetGroup()
+        removed_nodeset_group.addNodesConditional(group)
+        nodeset_group.removeNodesConditional(removal_condition)
+        removed_nodeset_group.removeNodesConditional(group)
+        removed = [node.getIdentifier() for node in iterate_nodes(removed_nodeset_group)]
+        del removed_nodeset_group
+        del removed_group
+    return removed
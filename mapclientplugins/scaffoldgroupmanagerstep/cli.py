@@ -0,0 +1,87 @@
+"""
+Headless command line entry point, installed as scaffold-regroup.
+
+Usage:
+    scaffold-regroup groups.config heart.exf
+    scaffold-regroup groups.config "fits/*.exf" --jobs 8
+    scaffold-regroup groups.config "fits/*.exf" --preflight-only
+"""
+import sys
+import json
+import argparse
+
+from mapclientplugins.scaffoldgroupmanagerstep.batch import expand_scaffold_files, load_groups, regroup_files, \
+    print_result
+from mapclientplugins.scaffoldgroupmanagerstep.output import OUTPUT_FORMATS, OUTPUT_FORMAT_EX
+
+
+def print_progress(phase, done, total, detail):
+    print('{0} {1}/{2} {3}'.format(phase, done, total, detail).rstrip(), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='scaffold-regroup',
+                                     description='Regroup scaffold files with a groups config.')
+    parser.add_argument('groups_config', help='groups.config file with the group rules')
+    parser.add_argument('scaffold_files', nargs='+', help='scaffold files or glob patterns')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT_EX)
+    parser.add_argument('--binary-sidecar', action='store_true', help='also write an .npz sidecar')
+    parser.add_argument('--lazy-load', action='store_true',
+                        help='read only the fields the rules need (requires --output-format groups.exf)')
+    parser.add_argument('--coordinates-field', help='name of the coordinates field, found by search if not given')
+    parser.add_argument('--report', help='write the json timing report (single file) to this file')
+    parser.add_argument('--rebuild-subelements', action='store_true',
+                        help='trim the lines and nodes of trimmed face groups to those of their remaining faces')
+    parser.add_argument('--shard-processes', type=int, default=1, metavar='N',
+                        help='write the shards of --output-format shards.json in N forked processes')
+    parser.add_argument('--memory-budget', type=int, default=0, metavar='MB',
+                        help='process the groups in chunks estimated to fit this many megabytes with the mesh, '
+                             'which every chunk reads again, failing if a chunk grew the process by more once it '
+                             'had run; an estimate, not a limit on memory (root region rules only)')
+    parser.add_argument('--state', help='json file of the last results (single file), reused for unchanged rules')
+    parser.add_argument('--progress', action='store_true', help='print progress per phase and group (single file)')
+    parser.add_argument('--no-preflight', action='store_true',
+                        help='skip checking the rules against the file headers before loading')
+    parser.add_argument('--preflight-only', action='store_true',
+                        help='only check the rules and print the work and memory estimates')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes for many files')
+    args = parser.parse_args(argv)
+
+    groups = load_groups(args.groups_config)
+    options = {
+        'output_format': args.output_format,
+        'binary_sidecar': args.binary_sidecar,
+        'lazy_load': args.lazy_load,
+        'coordinates_field_name': args.coordinates_field,
+        'run_preflight': not args.no_preflight,
+        'rebuild_subelements': args.rebuild_subelements,
+        'memory_budget': args.memory_budget * 1024 ** 2,
+        'shard_processes': args.shard_processes,
+    }
+    input_files = expand_scaffold_files(args.scaffold_files)
+    if args.preflight_only:
+        from mapclientplugins.scaffoldgroupmanagerstep.preflight import preflight
+
+        succeeded = True
+        for input_file in input_files:
+            report = preflight(input_file, groups.get('groups', []), args.coordinates_field)
+            print(json.dumps(report.to_dict(), indent=4))
+            succeeded = succeeded and report.succeeded()
+        return 0 if succeeded else 1
+    if len(input_files) == 1:
+        # A single file runs in this process, avoiding the process pool start up.
+        from mapclientplugins.scaffoldgroupmanagerstep.scaffoldgroupmanager import regroup_scaffold
+
+        manager = regroup_scaffold(input_files[0], groups, state_file=args.state,
+                                   progress_callback=print_progress if args.progress else None, **options)
+        print(manager.get_output_file_name())
+        if args.report:
+            manager.get_report().write(args.report)
+        return 0
+
+    results = regroup_files(input_files, groups, max_workers=args.jobs, callback=print_result, options=options)
+    return 1 if any(not result.succeeded() for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Pure data validation of the step configuration and groups config, usable
+without creating any widgets.
+"""
+import os
+import json
+
+from mapclientplugins.scaffoldgroupmanagerstep.output import OUTPUT_FORMATS, OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP, \
+    OUTPUT_FORMAT_EX_SHARDS, OUTPUT_FORMAT_GROUPS_DELTA
+from mapclientplugins.scaffoldgroupmanagerstep.rules import parse_rule
+
+GROUPS_CONFIG_FILE_NAME = 'groups.config'
+# Shards are only written in parallel by forking, which the step cannot do from its
+# threaded GUI process, and written serially they are slower than one EX file, so
+# sharded output is only offered by the command line.
+STEP_OUTPUT_FORMATS = tuple(output_format for output_format in OUTPUT_FORMATS
+                            if output_format != OUTPUT_FORMAT_EX_SHARDS)
+
+
+def validate_identifier(identifier, identifier_occurs_count, previous_identifier):
+    """
+    Determine if identifier is unique throughout the workflow.
+    The identifier_occurs_count method is part of the interface to the workflow framework.
+    """
+    value = identifier_occurs_count(identifier)
+    return (value == 0) or (value == 1 and previous_identifier == identifier)
+
+
+def get_groups_errors(groups):
+    """
+    Check groups against the groups config schema: a dict whose optional "groups"
+    entry is a list of "group, term, ..." rule strings (see rules.py).
+
+    :return: List of error messages, empty if groups is valid.
+    """
+    if not isinstance(groups, dict):
+        return ['Groups config must be a dictionary']
+    group_item_list = groups.get('groups', [])
+    if not isinstance(group_item_list, list):
+        return ['Groups config "groups" entry must be a list']
+    errors = []
+    for index, group_item in enumerate(group_item_list):
+        if not isinstance(group_item, str):
+            errors.append('Group rule {0} is not a string'.format(index + 1))
+        elif group_item.strip():
+            try:
+                rule = parse_rule(group_item)
+            except (KeyError, ValueError) as e:
+                errors.append('Group rule {0}: {1}'.format(index + 1, e.args[0]))
+                continue
+            if not rule.group_name:
+                errors.append('Group rule {0} has no group name'.format(index + 1))
+    return errors
+
+
+def get_config_errors(config):
+    """
+    Check the step settings other than the identifier.
+
+    :return: List of error messages, empty if config is valid.
+    """
+    errors = []
+    output_format = config.get('output_format')
+    if output_format == OUTPUT_FORMAT_EX_SHARDS:
+        errors.append('The {0} output format is only available from the command line'.format(output_format))
+    elif (output_format is not None) and (output_format not in OUTPUT_FORMATS):
+        errors.append('Output format {0} is not valid'.format(output_format))
+    if config.get('lazy_load') and (output_format != OUTPUT_FORMAT_GROUPS_DELTA):
+        errors.append('Lazy loading requires the {0} output format'.format(OUTPUT_FORMAT_GROUPS_DELTA))
+    if config.get('memory_output') and (output_format not in (None, OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP)):
+        errors.append('Memory output requires the {0} or {1} output format'.format(
+            OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP))
+    cache_size_limit = config.get('cache_size_limit')
+    if (cache_size_limit is not None) and not (isinstance(cache_size_limit, int) and cache_size_limit >= 0):
+        errors.append('Cache size limit must be a non-negative integer')
+    memory_budget_mb = config.get('memory_budget_mb')
+    if (memory_budget_mb is not None) and not (isinstance(memory_budget_mb, int) and memory_budget_mb >= 0):
+        errors.append('Memory budget must be a non-negative integer number of megabytes')
+    elif memory_budget_mb:
+        if output_format not in (None, OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP):
+            errors.append('A memory budget requires the {0} or {1} output format'.format(
+                OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP))
+        if config.get('binary_sidecar') or config.get('memory_output'):
+            errors.append('A memory budget cannot be used with the binary sidecar or memory output')
+    return errors
+
+
+def read_groups_config(location):
+    """
+    Read groups.config from the step location.
+
+    :return: The groups dict, or None if there is no groups.config.
+    """
+    file_name = os.path.join(location, GROUPS_CONFIG_FILE_NAME) if location else None
+    if not (file_name and os.path.isfile(file_name)):
+        return None
+    with open(file_name, "r") as f:
+        return json.loads(f.read())
+
+
+def validate_config(config, identifier_occurs_count, location=None):
+    """
+    Validate the step configuration and, if present, the groups.config in location.
+    """
+    if not validate_identifier(config['identifier'], identifier_occurs_count, config['identifier']):
+        return False
+    if get_config_errors(config):
+        return False
+    try:
+        groups = read_groups_config(location)
+    except (OSError, ValueError):
+        return False
+    return (groups is None) or (not get_groups_errors(groups))
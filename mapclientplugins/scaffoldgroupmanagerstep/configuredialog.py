@@ -3,11 +3,27 @@ import json
 
 from PySide6 import QtWidgets
 
+from mapclientplugins.scaffoldgroupmanagerstep.configuration import STEP_OUTPUT_FORMATS, get_config_errors, \
+    validate_identifier
 from mapclientplugins.scaffoldgroupmanagerstep.ui_configuredialog import Ui_ConfigureDialog
 from mapclientplugins.scaffoldgroupmanagerstep.ui_group_configuredialog import Ui_MehGroupConfigureDialog
 
 INVALID_STYLE_SHEET = 'background-color: rgba(239, 0, 0, 50)'
 DEFAULT_STYLE_SHEET = ''
+MEGABYTE = 1024 ** 2
+# Check box of each on/off setting, by config key.
+SETTING_CHECK_BOXES = {
+    'binary_sidecar': 'binarySidecarCheckBox',
+    'memory_output': 'memoryOutputCheckBox',
+    'lazy_load': 'lazyLoadCheckBox',
+    'classify_faces': 'classifyFacesCheckBox',
+    'rebuild_subelements': 'rebuildSubelementsCheckBox',
+    'preflight': 'preflightCheckBox',
+    'incremental': 'incrementalCheckBox',
+    'cache_enabled': 'cacheEnabledCheckBox',
+    'write_report': 'writeReportCheckBox',
+    'profile': 'profileCheckBox',
+}
 
 
 class ConfigFile(QtWidgets.QDialog):
@@ -33,6 +49,7 @@ class ConfigureDialog(QtWidgets.QDialog):
 
         self._ui = Ui_ConfigureDialog()
         self._ui.setupUi(self)
+        self._ui.outputFormatComboBox.addItems(STEP_OUTPUT_FORMATS)
 
         self._groups = {}
         self._location = location
@@ -55,6 +72,11 @@ class ConfigureDialog(QtWidgets.QDialog):
 
     def _makeConnections(self):
         self._ui.lineEdit0.textChanged.connect(self.validate)
+        self._ui.outputFormatComboBox.currentIndexChanged.connect(self.validate)
+        for check_box_name in SETTING_CHECK_BOXES.values():
+            getattr(self._ui, check_box_name).toggled.connect(self.validate)
+        self._ui.memoryBudgetSpinBox.valueChanged.connect(self.validate)
+        self._ui.cacheSizeLimitSpinBox.valueChanged.connect(self.validate)
         self._ui.pushButton.clicked.connect(self._fileChooserClicked)
         self._ui.pushButton_2.clicked.connect(self._edit)
 
@@ -117,16 +139,29 @@ class ConfigureDialog(QtWidgets.QDialog):
         set the style sheet to the INVALID_STYLE_SHEET.  Return the outcome of the
         overall validity of the configuration.
         """
-        # Determine if the current identifier is unique throughout the workflow
-        # The identifierOccursCount method is part of the interface to the workflow framework.
-        value = self.identifierOccursCount(self._ui.lineEdit0.text())
-        valid = (value == 0) or (value == 1 and self._previousIdentifier == self._ui.lineEdit0.text())
+        valid = validate_identifier(self._ui.lineEdit0.text(), self.identifierOccursCount, self._previousIdentifier)
         if valid:
             self._ui.lineEdit0.setStyleSheet(DEFAULT_STYLE_SHEET)
         else:
             self._ui.lineEdit0.setStyleSheet(INVALID_STYLE_SHEET)
 
-        return valid
+        errors = get_config_errors(self._getSettings())
+        self._ui.settingsErrorsLabel.setText('\n'.join(errors))
+        if errors:
+            self._ui.settingsErrorsLabel.setStyleSheet(INVALID_STYLE_SHEET)
+        else:
+            self._ui.settingsErrorsLabel.setStyleSheet(DEFAULT_STYLE_SHEET)
+
+        return valid and not errors
+
+    def _getSettings(self):
+        settings = {key: getattr(self._ui, check_box_name).isChecked()
+                    for key, check_box_name in SETTING_CHECK_BOXES.items()}
+        settings['output_format'] = self._ui.outputFormatComboBox.currentText()
+        settings['coordinates_field_name'] = self._ui.coordinatesFieldLineEdit.text().strip()
+        settings['memory_budget_mb'] = self._ui.memoryBudgetSpinBox.value()
+        settings['cache_size_limit'] = self._ui.cacheSizeLimitSpinBox.value() * MEGABYTE
+        return settings
 
     def getConfig(self):
         '''
@@ -137,6 +172,7 @@ class ConfigureDialog(QtWidgets.QDialog):
         self._previousIdentifier = self._ui.lineEdit0.text()
         config = {}
         config['identifier'] = self._ui.lineEdit0.text()
+        config.update(self._getSettings())
         return config
 
     def setConfig(self, config):
@@ -147,4 +183,10 @@ class ConfigureDialog(QtWidgets.QDialog):
         '''
         self._previousIdentifier = config['identifier']
         self._ui.lineEdit0.setText(config['identifier'])
+        for key, check_box_name in SETTING_CHECK_BOXES.items():
+            getattr(self._ui, check_box_name).setChecked(config[key])
+        self._ui.outputFormatComboBox.setCurrentText(config['output_format'])
+        self._ui.coordinatesFieldLineEdit.setText(config['coordinates_field_name'])
+        self._ui.memoryBudgetSpinBox.setValue(config['memory_budget_mb'])
+        self._ui.cacheSizeLimitSpinBox.setValue(config['cache_size_limit'] // MEGABYTE)
 
@@ -0,0 +1,65 @@
+"""
+Results of the last regroup, kept so a re-run only recomputes changed groups.
+
+Rules sharing no group are independent, so each set of rules sharing groups is
+keyed on its rule text and a digest of the source membership of its groups,
+taken from the scaffold file contents and the group sizes. The state file maps
+each key to the members those rules removed; on the next run a set with an
+unchanged key has its stored removals applied in bulk without classifying or
+evaluating anything.
+"""
+import os
+import json
+import hashlib
+
+STATE_FILE_NAME = 'regroup_state.json'
+
+
+def get_rule_set_key(rules, membership_digest):
+    """
+    :param rules: List of GroupRule sharing groups.
+    :param membership_digest: Hex digest of the source membership of their groups.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([rule.text for rule in rules]).encode())
+    digest.update(membership_digest.encode())
+    return digest.hexdigest()
+
+
+class RegroupState(object):
+    """
+    Json file of the removals made by each set of rules in the last regroup.
+    """
+
+    def __init__(self, file_name):
+        self._file_name = file_name
+        self._entries = {}
+        if os.path.isfile(file_name):
+            try:
+                with open(file_name, "r") as f:
+                    self._entries = json.loads(f.read()).get('rule_sets', {})
+            except (OSError, ValueError, AttributeError):
+                self._entries = {}
+
+    def get(self, key):
+        """
+        :return: Dict of (group name, dimension) to removed identifiers, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return {(group_name, dimension): identifiers for group_name, dimension, identifiers in entry['removed']}
+
+    def put(self, key, removed_identifiers):
+        self._entries[key] = {
+            'removed': [[group_name, dimension, list(identifiers)]
+                        for (group_name, dimension), identifiers in removed_identifiers.items()],
+        }
+
+    def write(self, keys):
+        """
+        Write the entries for keys, dropping all others.
+        """
+        self._entries = {key: self._entries[key] for key in keys if key in self._entries}
+        with open(self._file_name, "w") as f:
+            f.write(json.dumps({'rule_sets': self._entries}))
@@ -0,0 +1,112 @@
+"""
+The input scaffold mapped into memory once per execution.
+
+Hashing for the output cache and the preflight header scan take their bytes from
+one read-only mmap of the file, so they share a single read of it from disk, and
+the file is never copied whole into a Python buffer. The scan searches the mapping
+for header lines, counting the node and element records between them, without
+decoding the data lines. Zinc reads the scaffold by file name, from the pages the
+mapping has already brought into the page cache: its StreamresourceMemoryBuffer
+only accepts bytes or str, which would copy the whole file. Gzip compressed and
+empty files cannot be used as mapped, so they are opened by name as before.
+"""
+import os
+import re
+import mmap
+import hashlib
+
+from mapclientplugins.scaffoldgroupmanagerstep.cache import hash_file
+
+
+# Header lines of an EX file following a newline: a group header with the
+# identifier ranges listed after it, a field definition "1) name, ...", or any
+# other line not starting with white space or a digit, except the "Node:" and
+# "Element:" records. Searching from one newline to the next is left to re.
+_HEADER_LINES_PATTERN = re.compile(
+    rb'\n(?:(?:Node|Element) group:[^\n]*(?:\n[ \t]*\d[^\n]*)*|[ \t]*\d+\)[^\n]*|(?!(?:Node|Element):)[^\s\d][^\n]*)')
+_NODE_RECORD = b'\nNode:'
+_ELEMENT_RECORD = b'\nElement:'
+# Most bytes copied from the mapping at once to count records.
+_COUNT_CHUNK_SIZE = 1 << 24
+
+
+class MappedInputFile(object):
+    """
+    Read-only mapping of an input scaffold file, closed on leaving a with block.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._file = None
+        self._mapping = None
+        self._hexdigest = None
+        if (not file_name.endswith('.gz')) and (os.path.getsize(file_name) > 0):
+            self._file = open(file_name, 'rb')
+            try:
+                self._mapping = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def is_mapped(self):
+        return self._mapping is not None
+
+    def get_buffer(self):
+        """
+        :return: The mapping, supporting the buffer protocol, or None if not mapped.
+        """
+        return self._mapping
+
+    def get_hexdigest(self):
+        """
+        :return: Hex sha256 of the file contents, as cache.hash_file.
+        """
+        if self._hexdigest is None:
+            self._hexdigest = hashlib.sha256(self._mapping).hexdigest() if self.is_mapped() \
+                else hash_file(self.file_name)
+        return self._hexdigest
+
+    def _count(self, pattern, start, end):
+        """
+        :return: Number of occurrences of pattern starting in the mapping from start to end.
+        """
+        count = 0
+        for chunk_start in range(start, end, _COUNT_CHUNK_SIZE):
+            chunk_end = min(chunk_start + _COUNT_CHUNK_SIZE + len(pattern) - 1, end)
+            count += self._mapping[chunk_start:chunk_end].count(pattern)
+        return count
+
+    def iterate_header_lines(self):
+        """
+        Search the mapping for the lines of the file preflight.scan_header reads
+        other than the node and element records, which are only counted.
+
+        :return: Iterator over (lines, node count, element count) with the header
+        lines as text with universal newlines and the number of "Node:" and
+        "Element:" records preceding them. A final item with no lines gives the
+        records after the last header line.
+        """
+        mapping = self._mapping
+        end = mapping.find(b'\n')
+        end = len(mapping) if end < 0 else end
+        yield [mapping[:end].decode(errors='replace').rstrip('\r') + '\n'], 0, 0
+        for match in _HEADER_LINES_PATTERN.finditer(mapping, end):
+            start = match.start()
+            lines = [line.rstrip('\r') + '\n' for line in match.group(0)[1:].decode(errors='replace').split('\n')]
+            yield lines, self._count(_NODE_RECORD, end, start), self._count(_ELEMENT_RECORD, end, start)
+            end = match.end()
+        yield [], self._count(_NODE_RECORD, end, len(mapping)), self._count(_ELEMENT_RECORD, end, len(mapping))
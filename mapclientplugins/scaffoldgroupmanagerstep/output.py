@@ -0,0 +1,281 @@
+"""
+Writers for the regrouped scaffold.
+
+The region is written as text EX, optionally gzip compressed, and can be
+accompanied by a compact binary .npz sidecar holding the node coordinates and
+the element and node identifiers of every group.  Alternatively only the
+modified groups are written as a delta over the original scaffold, described
+by a small json manifest, or the region is written as one shard per domain with
+a json index of the shards.
+"""
+import os
+import gzip
+import json
+
+from opencmiss.zinc.field import Field
+from opencmiss.zinc.result import RESULT_OK
+
+from mapclientplugins.scaffoldgroupmanagerstep.classification import iterate_elements, iterate_nodes
+from mapclientplugins.scaffoldgroupmanagerstep.preflight import open_text, is_identifier_ranges, \
+    parse_identifier_ranges, format_identifier_ranges
+
+OUTPUT_FORMAT_EX = 'exf'
+OUTPUT_FORMAT_EX_GZIP = 'exf.gz'
+OUTPUT_FORMAT_GROUPS_DELTA = 'groups.exf'
+OUTPUT_FORMAT_EX_SHARDS = 'shards.json'
+OUTPUT_FORMATS = (OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP, OUTPUT_FORMAT_GROUPS_DELTA, OUTPUT_FORMAT_EX_SHARDS)
+SIDECAR_EXTENSION = 'npz'
+MANIFEST_EXTENSION = 'manifest.json'
+
+
+def output_file_name(base_name, output_format):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Output format {} is not valid".format(output_format))
+    return base_name + '.' + output_format
+
+
+def make_output_description(output_format, output_file, sidecar_file=None, manifest_file=None, shard_files=None):
+    """
+    Describe the files written for the provides port, so downstream steps can
+    tell which format they are given. For sharded output the file is the index.
+    """
+    return {
+        'format': output_format,
+        'file': output_file,
+        'sidecar': sidecar_file,
+        'sidecar_format': SIDECAR_EXTENSION if sidecar_file else None,
+        'manifest': manifest_file,
+        'shards': shard_files,
+    }
+
+
+def write_region_to_buffer(region):
+    """
+    Write region as text EX into memory and return the bytes.
+    """
+    stream_information = region.createStreaminformationRegion()
+    memory_resource = stream_information.createStreamresourceMemory()
+    result = region.write(stream_information)
+    assert result == RESULT_OK, "Failed to write region to memory"
+    result, buffer = memory_resource.getBuffer()
+    assert result == RESULT_OK, "Failed to get region memory buffer"
+    return buffer.encode() if isinstance(buffer, str) else buffer
+
+
+def read_output_buffer(file_name, output_format):
+    """
+    Read a previously written output back as uncompressed EX bytes.
+
+    :return: The bytes, or None for the groups delta and sharded formats.
+    """
+    if output_format == OUTPUT_FORMAT_EX:
+        with open(file_name, 'rb') as f:
+            return f.read()
+    if output_format == OUTPUT_FORMAT_EX_GZIP:
+        with gzip.open(file_name, 'rb') as f:
+            return f.read()
+    return None
+
+
+def write_region(region, file_name, output_format, buffer=None):
+    """
+    Write region to file_name in output_format.
+
+    :param buffer: Optional EX bytes already written from region with
+    write_region_to_buffer, saved as is instead of serialising region again.
+    """
+    if output_format == OUTPUT_FORMAT_EX:
+        if buffer is None:
+            result = region.writeFile(file_name)
+            assert result == RESULT_OK, "Failed to write model file " + str(file_name)
+        else:
+            with open(file_name, 'wb') as f:
+                f.write(buffer)
+    elif output_format == OUTPUT_FORMAT_EX_GZIP:
+        with gzip.open(file_name, 'wb', compresslevel=6) as f:
+            f.write(write_region_to_buffer(region) if buffer is None else buffer)
+    elif output_format == OUTPUT_FORMAT_GROUPS_DELTA:
+        raise ValueError("Groups delta output is written with write_groups_delta")
+    elif output_format == OUTPUT_FORMAT_EX_SHARDS:
+        raise ValueError("Sharded output is written with write_region_shards")
+    else:
+        raise ValueError("Output format {} is not valid".format(output_format))
+
+
+def write_groups_delta(region, file_name, group_names, domain_types=Field.DOMAIN_TYPE_MESH2D):
+    """
+    Write only the membership of group_names over domain_types, by default the
+    faces.  Node parameters and fields are not written; the members are listed
+    by identifier so the delta can be overlaid on the original scaffold.
+    """
+    if not group_names:
+        # An empty field name list means no restriction to Zinc, so write an empty delta.
+        open(file_name, 'w').close()
+        return
+    stream_information = region.createStreaminformationRegion()
+    file_resource = stream_information.createStreamresourceFile(file_name)
+    stream_information.setResourceFieldNames(file_resource, group_names)
+    stream_information.setResourceDomainTypes(file_resource, domain_types)
+    result = region.write(stream_information)
+    assert result == RESULT_OK, "Failed to write groups delta file " + str(file_name)
+
+
+def rewrite_group_membership(input_file, output_file, removed_identifiers):
+    """
+    Stream input_file to output_file removing members from the groups' identifier
+    ranges, without building a region.  Only the root region is rewritten, and
+    input_file must be EX version 2 or later where groups list their members by
+    identifier.  A .gz output_file is compressed.
+
+    :param removed_identifiers: Dict of (group name, dimension) to the identifiers
+    to remove, dimension 0 being nodes.
+    """
+    removed = {key: set(identifiers) for key, identifiers in removed_identifiers.items() if identifiers}
+    open_output = gzip.open if output_file.endswith('.gz') else open
+    group_name = None
+    dimension = 0
+    members_line = None
+    members = None
+    with open_text(input_file) as f, open_output(output_file, 'wt') as out:
+
+        def write_members():
+            remaining = sorted(set(members).difference(removed[(group_name, dimension)]))
+            # An empty membership list is left out entirely.
+            if remaining:
+                out.write(members_line)
+                out.write(format_identifier_ranges(remaining) + '\n')
+
+        for line in f:
+            if members is not None:
+                if is_identifier_ranges(line):
+                    members.extend(parse_identifier_ranges(line))
+                    continue
+                write_members()
+                members = None
+            if line.startswith('Group name:'):
+                group_name = line.split(':', 1)[1].strip()
+            elif line.startswith('Region:'):
+                group_name = None
+                dimension = 0
+                if line.split(':', 1)[1].strip() not in ('', '/'):
+                    # Groups of subregions are copied unchanged.
+                    removed = {}
+            elif line.startswith('!#nodeset'):
+                dimension = 0
+            elif line.startswith('!#mesh'):
+                dimension = int(line.split('dimension=', 1)[1].split(',')[0])
+            elif (line.startswith('Node group:') or line.startswith('Element group:')) and \
+                    ((group_name, dimension) in removed):
+                members_line = line
+                members = []
+                continue
+            out.write(line)
+        if members is not None:
+            write_members()
+
+
+def write_delta_manifest(file_name, base_file, delta_file, group_names, domain_names=('mesh2d',)):
+    """
+    The delta is named relative to the manifest, so the two can be copied together.
+    """
+    manifest = {
+        'base': os.path.abspath(base_file),
+        'delta': os.path.relpath(os.path.abspath(delta_file), os.path.dirname(os.path.abspath(file_name))),
+        'groups': list(group_names),
+        'domain': ','.join(domain_names),
+    }
+    with open(file_name, "w") as f:
+        f.write(json.dumps(manifest, indent=4))
+
+
+def read_delta_manifest(file_name):
+    """
+    :return: The manifest dict, with the delta path resolved against the manifest.
+    """
+    with open(file_name, "r") as f:
+        manifest = json.loads(f.read())
+    manifest['delta'] = os.path.join(os.path.dirname(os.path.abspath(file_name)), manifest['delta'])
+    return manifest
+
+
+def get_group_fields(field_module):
+    groups = []
+    field_iterator = field_module.createFielditerator()
+    field = field_iterator.next()
+    while field.isValid():
+        group = field.castGroup()
+        if group.isValid():
+            groups.append(group)
+        field = field_iterator.next()
+    return groups
+
+
+def get_domain_name(dimension):
+    return 'nodes' if dimension == 0 else 'mesh{0}d'.format(dimension)
+
+
+def get_group_membership_arrays(field_module):
+    """
+    Get the member identifiers of every group as NumPy int32 arrays.
+
+    The identifiers are read with Zinc node and element iterators, one Python
+    call per member, as the Zinc Python bindings have no bulk export of group
+    membership.
+
+    :return: Dict of group name to dict of domain name (nodes, mesh1d, mesh2d,
+    mesh3d) to sorted identifiers, for the domains the group has.
+    """
+    import numpy as np
+
+    nodes = field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES)
+    memberships = {}
+    for group in get_group_fields(field_module):
+        arrays = memberships[group.getName()] = {}
+        node_group = group.getFieldNodeGroup(nodes)
+        if node_group.isValid():
+            nodeset_group = node_group.getNodesetGroup()
+            arrays[get_domain_name(0)] = np.fromiter(
+                (node.getIdentifier() for node in iterate_nodes(nodeset_group)), dtype=np.int32,
+                count=nodeset_group.getSize())
+        for dimension in range(1, 4):
+            element_group = group.getFieldElementGroup(field_module.findMeshByDimension(dimension))
+            if element_group.isValid():
+                mesh_group = element_group.getMeshGroup()
+                arrays[get_domain_name(dimension)] = np.fromiter(
+                    (element.getIdentifier() for element in iterate_elements(mesh_group)), dtype=np.int32,
+                    count=mesh_group.getSize())
+    return memberships
+
+
+def write_binary_sidecar(field_module, coordinates_field, file_name):
+    """
+    Write node coordinates and group membership identifiers to an .npz file.
+
+    Arrays written: node_identifiers, coordinates (if coordinates_field is given),
+    group_names and, for each group and domain, group.<name>.<nodes|mesh1d|mesh2d|mesh3d>.
+    """
+    import numpy as np
+
+    nodes = field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES)
+    node_identifiers = []
+    coordinates = []
+    field_cache = field_module.createFieldcache()
+    for node in iterate_nodes(nodes):
+        node_identifiers.append(node.getIdentifier())
+        if coordinates_field:
+            field_cache.setNode(node)
+            result, values = coordinates_field.evaluateReal(field_cache, 3)
+            coordinates.append(values if result == RESULT_OK else [np.nan] * 3)
+
+    arrays = {'node_identifiers': np.array(node_identifiers, dtype=np.int32)}
+    if coordinates_field:
+        arrays['coordinates'] = np.array(coordinates, dtype=np.float64).reshape(-1, 3)
+
+    memberships = get_group_membership_arrays(field_module)
+    for name, domain_arrays in memberships.items():
+        for domain_name, identifiers in domain_arrays.items():
+            arrays['group.{0}.{1}'.format(name, domain_name)] = identifiers
+    arrays['group_names'] = np.array(list(memberships), dtype=np.str_)
+
+    with open(file_name, 'wb') as f:
+        np.savez_compressed(f, **arrays)
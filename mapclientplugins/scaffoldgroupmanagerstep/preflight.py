@@ -0,0 +1,334 @@
+"""
+Fail-fast preflight of a scaffold file against the group rules.
+
+The EX file is streamed as text without building any Zinc objects, collecting
+the field and group names and the node and element counts from its headers.
+The rules are checked against these, and the work and memory of the full load
+are estimated, so a typo in groups.config is reported in seconds rather than
+after loading a large scaffold.
+"""
+import os
+import re
+import gzip
+
+from mapclientplugins.scaffoldgroupmanagerstep.rules import compile_rules
+
+# Rough in-memory cost of a Zinc node or element, excluding field parameters.
+BYTES_PER_NODE = 160
+BYTES_PER_ELEMENT = 240
+BYTES_PER_PARAMETER = 8
+
+_FIELD_PATTERN = re.compile(r'^\s*\d+\)\s*([^,]+),.*#Components=(\d+)')
+_DIMENSION_PATTERN = re.compile(r'dimension\s*=\s*(\d)', re.IGNORECASE)
+_VERSION_PATTERN = re.compile(r'^EX\s+Version:\s*(\d+)')
+
+
+def open_text(file_name):
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, 'rt', errors='replace')
+    return open(file_name, 'r', errors='replace')
+
+
+def is_identifier_ranges(line):
+    return line.lstrip()[:1].isdigit()
+
+
+def parse_identifier_ranges(text):
+    """
+    Parse EX group membership such as "1..24,30" into a list of identifiers.
+    """
+    identifiers = []
+    for item in text.replace(' ', ',').split(','):
+        item = item.strip()
+        if item:
+            first, _, last = item.partition('..')
+            identifiers.extend(range(int(first), int(last or first) + 1))
+    return identifiers
+
+
+def count_identifier_ranges(text):
+    count = 0
+    for item in text.replace(' ', ',').split(','):
+        item = item.strip()
+        if item:
+            first, _, last = item.partition('..')
+            count += int(last or first) - int(first) + 1
+    return count
+
+
+def format_identifier_ranges(identifiers):
+    """
+    Format sorted identifiers as EX group membership ranges.
+    """
+    ranges = []
+    start = previous = None
+    for identifier in identifiers:
+        if (previous is not None) and (identifier == previous + 1):
+            previous = identifier
+            continue
+        if start is not None:
+            ranges.append(str(start) if start == previous else '{0}..{1}'.format(start, previous))
+        start = previous = identifier
+    if start is not None:
+        ranges.append(str(start) if start == previous else '{0}..{1}'.format(start, previous))
+    return ','.join(ranges)
+
+
+class ScaffoldHeader(object):
+    """
+    Names and sizes read from the headers of an EX file.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.file_size = os.path.getsize(file_name)
+        self.version = None
+        self.field_names = []
+        self.group_names = []
+        self.node_count = 0
+        self.element_counts = {1: 0, 2: 0, 3: 0}
+        # Most components of the node fields of any node template.
+        self.node_components = 0
+        # Members of each group listed by identifier ranges, by (group name, dimension).
+        self.group_sizes = {}
+
+    def get_parameter_estimate(self):
+        return self.node_count * max(self.node_components, 1)
+
+
+class _HeaderScan(object):
+    """
+    State of a scan of the lines of an EX file into a ScaffoldHeader.
+    """
+
+    def __init__(self, file_name):
+        self.header = ScaffoldHeader(file_name)
+        self.legacy = True
+        self._in_group = False
+        self._group_name = None
+        self._group_size_key = None
+        self._in_node_header = False
+        self._template_components = 0
+        self._dimension = 0
+        self._node_identifiers = set()
+        self._element_identifiers = {1: set(), 2: set(), 3: set()}
+
+    def read_lines(self, lines):
+        """
+        Read lines, as iterating open_text would give them.
+        """
+        header = self.header
+        legacy = self.legacy
+        in_group = self._in_group
+        group_name = self._group_name
+        group_size_key = self._group_size_key
+        in_node_header = self._in_node_header
+        template_components = self._template_components
+        dimension = self._dimension
+        node_identifiers = self._node_identifiers
+        element_identifiers = self._element_identifiers
+        for line in lines:
+            first = line[:1]
+            if legacy and (first == ' '):
+                # Legacy files indent their headers by a space.
+                line = line.lstrip(' ')
+                first = line[:1]
+            if (first in ' \t\n') or first.isdigit():
+                if group_size_key and is_identifier_ranges(line):
+                    header.group_sizes[group_size_key] = \
+                        header.group_sizes.get(group_size_key, 0) + count_identifier_ranges(line)
+                    continue
+                # Only the "1) name, ..." field definitions are of interest among other data lines.
+                if ')' in line:
+                    match = _FIELD_PATTERN.match(line)
+                    if match:
+                        field_name = match.group(1).strip()
+                        if field_name not in header.field_names:
+                            header.field_names.append(field_name)
+                        if in_node_header:
+                            template_components += int(match.group(2))
+                continue
+            group_size_key = None
+            if first == 'N':
+                if line.startswith('Node group:'):
+                    group_size_key = (group_name, 0) if in_group else None
+                elif line.startswith('Node:'):
+                    if legacy:
+                        node_identifiers.add(line.split()[1])
+                    elif not in_group:
+                        header.node_count += 1
+                    if template_components > header.node_components:
+                        header.node_components = template_components
+                continue
+            if first == 'E':
+                if line.startswith('Element group:'):
+                    group_size_key = (group_name, dimension) if in_group else None
+                elif line.startswith('Element:'):
+                    if dimension in header.element_counts:
+                        if legacy:
+                            # Legacy elements are identified by their element, face and line numbers.
+                            element_identifiers[dimension].add(line.split(':', 1)[1].strip())
+                        elif not in_group:
+                            header.element_counts[dimension] += 1
+                elif line.startswith('EX'):
+                    match = _VERSION_PATTERN.match(line)
+                    if match:
+                        header.version = int(match.group(1))
+                        legacy = header.version < 2
+                continue
+            if line.startswith('Group name:'):
+                group_name = line.split(':', 1)[1].strip()
+                if group_name not in header.group_names:
+                    header.group_names.append(group_name)
+                in_group = True
+            elif line.startswith('Region:'):
+                in_group = False
+                group_name = None
+            elif line.startswith('!#mesh') or line.startswith('Shape.'):
+                match = _DIMENSION_PATTERN.search(line)
+                dimension = int(match.group(1)) if match else dimension
+                in_node_header = dimension == 0
+                if in_node_header:
+                    template_components = 0
+            elif line.startswith('!#nodeset'):
+                dimension = 0
+                in_node_header = True
+                template_components = 0
+            elif line.startswith('#Fields'):
+                template_components = 0
+        self.legacy = legacy
+        self._in_group = in_group
+        self._group_name = group_name
+        self._group_size_key = group_size_key
+        self._in_node_header = in_node_header
+        self._template_components = template_components
+        self._dimension = dimension
+
+    def add_records(self, node_count, element_count):
+        """
+        Count node_count "Node:" and element_count "Element:" lines following
+        the lines read so far, as read_lines would. Not for legacy files, where
+        the identifiers of the records are needed.
+        """
+        header = self.header
+        if self._in_group:
+            return
+        if node_count:
+            header.node_count += node_count
+            if self._template_components > header.node_components:
+                header.node_components = self._template_components
+        if element_count and (self._dimension in header.element_counts):
+            header.element_counts[self._dimension] += element_count
+
+    def get_header(self):
+        header = self.header
+        if self.legacy:
+            header.node_count = len(self._node_identifiers)
+            for dimension, identifiers in self._element_identifiers.items():
+                header.element_counts[dimension] = len(identifiers)
+        return header
+
+
+def scan_header(file_name, input_file=None):
+    """
+    Stream file_name collecting its field and group names and node and element
+    counts. Node and element data lines are skipped, not parsed.
+
+    :param input_file: Optional open MappedInputFile of file_name. Its mapping
+    is searched for the header lines, with the node and element records between
+    them counted, instead of reading the file line by line.
+
+    Legacy EX files (before version 2) define the nodes and elements inside each
+    group, so their identifiers are collected to count each only once. These are
+    always read line by line.
+
+    :return: ScaffoldHeader.
+    """
+    if (input_file is not None) and input_file.is_mapped():
+        scan = _HeaderScan(file_name)
+        for lines, node_count, element_count in input_file.iterate_header_lines():
+            scan.add_records(node_count, element_count)
+            scan.read_lines(lines)
+            if scan.legacy:
+                break
+        else:
+            return scan.get_header()
+    scan = _HeaderScan(file_name)
+    with open_text(file_name) as f:
+        scan.read_lines(f)
+    return scan.get_header()
+
+
+class PreflightReport(object):
+    """
+    Errors and warnings found checking rules against a ScaffoldHeader, with
+    estimates of the work and memory of the full load and regroup.
+    """
+
+    def __init__(self, header):
+        self.header = header
+        self.errors = []
+        self.warnings = []
+        self.estimated_memory = 0
+        self.estimated_evaluations = 0
+
+    def succeeded(self):
+        return not self.errors
+
+    def to_dict(self):
+        return {
+            'file': self.header.file_name,
+            'file_size': self.header.file_size,
+            'node_count': self.header.node_count,
+            'element_counts': self.header.element_counts,
+            'group_count': len(self.header.group_names),
+            'estimated_memory': self.estimated_memory,
+            'estimated_evaluations': self.estimated_evaluations,
+            'errors': self.errors,
+            'warnings': self.warnings,
+        }
+
+
+def preflight(file_name, group_item_list, coordinates_field_name=None, input_file=None):
+    """
+    Check group_item_list against the headers of file_name without loading it.
+
+    :param coordinates_field_name: Field the load requires, if given.
+    :param input_file: Optional open MappedInputFile of file_name.
+    :return: PreflightReport. Rule syntax errors raise from compile_rules.
+    """
+    return check_rules(scan_header(file_name, input_file), group_item_list, coordinates_field_name)
+
+
+def check_rules(header, group_item_list, coordinates_field_name=None):
+    """
+    Check group_item_list against a ScaffoldHeader already scanned.
+
+    :return: PreflightReport. Rule syntax errors raise from compile_rules.
+    """
+    file_name = header.file_name
+    report = PreflightReport(header)
+    plan = compile_rules(group_item_list)
+    group_names = set(header.group_names)
+    for rule in plan.rules:
+        for group_name in [rule.group_name] + (rule.condition.get_group_names() if rule.condition else []):
+            if group_name not in group_names:
+                message = 'Group {0} in rule "{1}" is not in {2}'.format(group_name, rule.text, file_name)
+                if message not in report.errors:
+                    report.errors.append(message)
+    if coordinates_field_name and (coordinates_field_name not in header.field_names):
+        report.errors.append('Coordinates field {0} is not in {1}'.format(coordinates_field_name, file_name))
+    if not header.element_counts[3]:
+        report.warnings.append('{0} has no 3D elements, so no face is exterior'.format(file_name))
+
+    element_count = sum(header.element_counts.values())
+    report.estimated_memory = header.node_count * BYTES_PER_NODE + element_count * BYTES_PER_ELEMENT + \
+        header.get_parameter_estimate() * BYTES_PER_PARAMETER
+    # One conditional pass per classification flag, then a lookup per member per rule.
+    for dimension in (1, 2):
+        flags = plan.get_flags(dimension)
+        rule_count = sum(1 for rule in plan.rules if rule.dimension == dimension)
+        report.estimated_evaluations += header.element_counts[dimension] * (bin(flags).count('1') + rule_count)
+    report.estimated_evaluations += header.element_counts[2] * \
+        sum(1 for rule in plan.rules if rule.dimension == 0)
+    return report
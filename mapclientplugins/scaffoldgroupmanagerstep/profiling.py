@@ -0,0 +1,140 @@
+"""
+Timing and resource instrumentation for the regroup pipeline.
+"""
+import os
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where RSS is not reported.
+    resource = None
+
+
+def get_peak_rss():
+    """
+    Get the peak resident set size of this process in bytes, or None if it
+    cannot be read on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_current_rss():
+    """
+    Get the current resident set size of this process in bytes, the peak where
+    the current size is not available, or None if neither can be read.
+    """
+    if resource is not None:
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * resource.getpagesize()
+        except (OSError, ValueError, IndexError):
+            pass
+    return get_peak_rss()
+
+
+def get_file_size(file_name):
+    return os.path.getsize(file_name) if file_name and os.path.isfile(file_name) else None
+
+
+class RegroupReport(object):
+    """
+    Per phase wall and CPU times, faces removed per group, peak RSS and the sizes
+    of the files read and written by a ScaffoldGroupManager.
+
+    With profile=True each outermost phase also runs under cProfile and tracemalloc,
+    and the report includes their top entries.  Phases may be nested.
+
+    A manager starts a report per apply. Its load_report holds the preflight and
+    load of the region the apply used, which later applies to the same loaded
+    region share.
+    """
+
+    def __init__(self, profile=False, load_report=None):
+        self._profile = profile
+        self.load_report = load_report
+        self._depth = 0
+        self.phases = []
+        self.removed_counts = {}
+        self.files_read = {}
+        self.files_written = {}
+        self.peak_rss = None
+        self.preflight = None
+        self.memory_budget = None
+        self.chunk_memory = []
+        self.reused_groups = []
+        self.subelement_counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        profiler = None
+        if self._profile and (self._depth == 0):
+            profiler = cProfile.Profile()
+            tracemalloc.start()
+            profiler.enable()
+        self._depth += 1
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            record = {
+                'name': name,
+                'wall_time': time.perf_counter() - wall_start,
+                'cpu_time': time.process_time() - cpu_start,
+            }
+            if profiler:
+                profiler.disable()
+                _, record['traced_memory_peak'] = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                stream = io.StringIO()
+                pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(20)
+                record['profile'] = stream.getvalue()
+            self.phases.append(record)
+            self.peak_rss = get_peak_rss()
+
+    def add_file_read(self, file_name):
+        self.files_read[file_name] = get_file_size(file_name)
+
+    def add_file_written(self, file_name):
+        if file_name:
+            self.files_written[file_name] = get_file_size(file_name)
+
+    def get_phase_time(self, name):
+        """
+        Get the total wall time of the phases called name, including those of the load report.
+        """
+        phases = self.phases + (self.load_report.phases if self.load_report else [])
+        return sum(record['wall_time'] for record in phases if record['name'] == name)
+
+    def to_dict(self):
+        load_report = self.load_report or RegroupReport()
+        return {
+            'phases': self.phases,
+            'load_phases': load_report.phases,
+            'removed_counts': self.removed_counts,
+            'files_read': dict(load_report.files_read, **self.files_read),
+            'files_written': self.files_written,
+            'peak_rss': self.peak_rss or load_report.peak_rss,
+            'preflight': self.preflight or load_report.preflight,
+            'memory_budget': self.memory_budget,
+            'chunk_memory': self.chunk_memory,
+            'reused_groups': self.reused_groups,
+            'subelement_counts': self.subelement_counts,
+        }
+
+    def write(self, file_name):
+        with open(file_name, "w") as f:
+            f.write(json.dumps(self.to_dict(), indent=4))
@@ -0,0 +1,32 @@
+"""
+Readers for the input scaffold.
+"""
+from opencmiss.zinc.field import Field
+
+# Faces need their parent 3D elements to be classified as exterior, and the
+# element field templates need the nodes to give the element connectivity.
+LAZY_DOMAIN_TYPES = Field.DOMAIN_TYPE_NODES | Field.DOMAIN_TYPE_MESH3D | Field.DOMAIN_TYPE_MESH2D
+
+
+def read_region_from_buffer(region, buffer):
+    """
+    Read EX bytes, such as the in-memory output of the scaffold group manager, into region.
+
+    :return: Zinc result of the read.
+    """
+    stream_information = region.createStreaminformationRegion()
+    stream_information.createStreamresourceMemoryBuffer(buffer)
+    return region.read(stream_information)
+
+
+def read_region_restricted(region, file_name, field_names, domain_types=LAZY_DOMAIN_TYPES):
+    """
+    Read only field_names over domain_types from file_name into region.
+
+    :return: Zinc result of the read.
+    """
+    stream_information = region.createStreaminformationRegion()
+    file_resource = stream_information.createStreamresourceFile(file_name)
+    stream_information.setResourceFieldNames(file_resource, field_names)
+    stream_information.setResourceDomainTypes(file_resource, domain_types)
+    return region.read(stream_information)
@@ -0,0 +1,434 @@
+"""
+Group rule language and compiler.
+
+A group rule is a string from groups.config:
+
+    group, term, term, ...
+
+Each term is either an option or a selector expression. The option dim=N selects
+whether the group's faces (2, the default), lines (1) or nodes (0) are trimmed,
+and region=PATH the region holding the group: the root region / by default, or
+* for every region with a group of that name. The selectors of a rule are OR'd
+together and the group keeps only the faces or lines satisfying them; with dim=0
+it keeps the nodes of its faces satisfying them.
+
+Selector expressions combine these atoms with and, or, not and parentheses:
+
+    inner, outer        exterior face on the xi3 = 0 / xi3 = 1 side of its parent
+    exterior            any exterior face or line
+    xi1_0 ... xi3_1     on the given face of the parent element, exterior or not
+    in "other group"    also in the named group
+
+e.g. "LV, inner", "septum, dim=1, (xi1_0 or xi1_1) and not in \"RV\"" or
+"wall, region=/heart/atria, outer".
+
+Rules are parsed once into an AST and validated without a mesh. A GroupRulePlan
+holds each distinct condition once. Binding it to a field module builds one
+shared Zinc field graph, with a single field per distinct subexpression.
+"""
+import re
+from functools import lru_cache
+
+from opencmiss.zinc.element import Element
+
+from mapclientplugins.scaffoldgroupmanagerstep.classification import FACE_EXTERIOR, FACE_TYPE_FLAGS
+
+FACE_TYPE_ATOMS = {
+    'xi1_0': Element.FACE_TYPE_XI1_0,
+    'xi1_1': Element.FACE_TYPE_XI1_1,
+    'xi2_0': Element.FACE_TYPE_XI2_0,
+    'xi2_1': Element.FACE_TYPE_XI2_1,
+    'xi3_0': Element.FACE_TYPE_XI3_0,
+    'xi3_1': Element.FACE_TYPE_XI3_1,
+}
+# Flags which must all be set for each named atom.
+ATOM_FLAGS = {
+    'exterior': FACE_EXTERIOR,
+    'inner': FACE_EXTERIOR | FACE_TYPE_FLAGS[Element.FACE_TYPE_XI3_0],
+    'outer': FACE_EXTERIOR | FACE_TYPE_FLAGS[Element.FACE_TYPE_XI3_1],
+}
+ATOM_FLAGS.update({name: FACE_TYPE_FLAGS[face_type] for name, face_type in FACE_TYPE_ATOMS.items()})
+
+DIMENSIONS = (0, 1, 2)
+DEFAULT_DIMENSION = 2
+ROOT_REGION_PATH = '/'
+ALL_REGIONS = '*'
+
+_TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|\'([^\']*)\'|([A-Za-z0-9_]+)|(\S))')
+
+
+class Atom(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.key = name
+
+    def get_flags(self):
+        return ATOM_FLAGS[self.name]
+
+    def get_group_names(self):
+        return []
+
+
+class InGroup(object):
+
+    def __init__(self, group_name):
+        self.group_name = group_name
+        self.key = 'in "{0}"'.format(group_name)
+
+    def get_flags(self):
+        return 0
+
+    def get_group_names(self):
+        return [self.group_name]
+
+
+class Not(object):
+
+    def __init__(self, child):
+        self.child = child
+        self.key = 'not ' + child.key
+
+    def get_flags(self):
+        return self.child.get_flags()
+
+    def get_group_names(self):
+        return self.child.get_group_names()
+
+
+class _Combination(object):
+
+    operator = None
+
+    def __init__(self, children):
+        # Flatten nested combinations of the same kind and drop duplicates so
+        # equivalent expressions share a key.
+        flattened = {}
+        for child in children:
+            for grandchild in (child.children if isinstance(child, type(self)) else [child]):
+                flattened[grandchild.key] = grandchild
+        self.children = [flattened[key] for key in sorted(flattened)]
+        self.key = '(' + (' ' + self.operator + ' ').join(child.key for child in self.children) + ')'
+
+    def get_flags(self):
+        flags = 0
+        for child in self.children:
+            flags |= child.get_flags()
+        return flags
+
+    def get_group_names(self):
+        return [name for child in self.children for name in child.get_group_names()]
+
+
+class And(_Combination):
+    operator = 'and'
+
+
+class Or(_Combination):
+    operator = 'or'
+
+
+def _combine(cls, children):
+    combination = cls(children)
+    return combination.children[0] if len(combination.children) == 1 else combination
+
+
+class GroupRule(object):
+
+    def __init__(self, group_name, dimension, condition, text, region_path=ROOT_REGION_PATH):
+        self.group_name = group_name
+        self.dimension = dimension
+        self.condition = condition
+        self.text = text
+        self.region_path = region_path
+
+    def applies_to(self, region_path):
+        return self.region_path in (region_path, ALL_REGIONS)
+
+    def __repr__(self):
+        return self.text
+
+
+class _Parser(object):
+
+    def __init__(self, text):
+        self._text = text
+        self._tokens = []
+        for match in _TOKEN_PATTERN.finditer(text):
+            open_parenthesis, close_parenthesis, double_quoted, single_quoted, word, other = match.groups()
+            if other is not None:
+                raise ValueError('Unexpected "{0}" in selector "{1}"'.format(other, text))
+            if word is not None:
+                self._tokens.append(('word', word.lower() if word.lower() in ('and', 'or', 'not', 'in') else word))
+            elif (double_quoted is not None) or (single_quoted is not None):
+                self._tokens.append(('name', double_quoted if double_quoted is not None else single_quoted))
+            else:
+                self._tokens.append(('symbol', open_parenthesis or close_parenthesis))
+        self._position = 0
+
+    def _peek(self):
+        return self._tokens[self._position] if self._position < len(self._tokens) else (None, None)
+
+    def _next(self):
+        token = self._peek()
+        self._position += 1
+        return token
+
+    def parse(self):
+        if not self._tokens:
+            raise ValueError('Empty selector')
+        node = self._parse_or()
+        if self._position != len(self._tokens):
+            raise ValueError('Unexpected "{0}" in selector "{1}"'.format(self._peek()[1], self._text))
+        return node
+
+    def _parse_or(self):
+        children = [self._parse_and()]
+        while self._peek() == ('word', 'or'):
+            self._next()
+            children.append(self._parse_and())
+        return _combine(Or, children)
+
+    def _parse_and(self):
+        children = [self._parse_not()]
+        while self._peek() == ('word', 'and'):
+            self._next()
+            children.append(self._parse_not())
+        return _combine(And, children)
+
+    def _parse_not(self):
+        if self._peek() == ('word', 'not'):
+            self._next()
+            child = self._parse_not()
+            return child.child if isinstance(child, Not) else Not(child)
+        return self._parse_atom()
+
+    def _parse_atom(self):
+        kind, value = self._next()
+        if (kind, value) == ('symbol', '('):
+            node = self._parse_or()
+            if self._next() != ('symbol', ')'):
+                raise ValueError('Missing ")" in selector "{0}"'.format(self._text))
+            return node
+        if (kind, value) == ('word', 'in'):
+            kind, value = self._next()
+            if kind not in ('name', 'word') or value in ('and', 'or', 'not', 'in'):
+                raise ValueError('Expected a group name after "in" in selector "{0}"'.format(self._text))
+            return InGroup(value)
+        if kind == 'word' and value in ATOM_FLAGS:
+            return Atom(value)
+        if kind is None:
+            raise ValueError('Incomplete selector "{0}"'.format(self._text))
+        raise KeyError("Surface {} is not valid".format(value))
+
+
+def parse_selector(text):
+    """
+    Parse a selector expression into an AST.
+    Raises KeyError for an unknown surface and ValueError for bad syntax.
+    """
+    return _Parser(text).parse()
+
+
+def split_terms(group_item):
+    """
+    Split a rule at commas outside quotes and parentheses.
+    """
+    terms = []
+    depth = 0
+    quote = None
+    start = 0
+    for index, character in enumerate(group_item):
+        if quote:
+            if character == quote:
+                quote = None
+        elif character in '"\'':
+            quote = character
+        elif character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif (character == ',') and (depth == 0):
+            terms.append(group_item[start:index].strip())
+            start = index + 1
+    terms.append(group_item[start:].strip())
+    return terms
+
+
+def normalise_region_path(path):
+    path = path.strip()
+    if path == ALL_REGIONS:
+        return path
+    return '/' + '/'.join(name for name in path.split('/') if name)
+
+
+def parse_rule(group_item):
+    terms = split_terms(group_item)
+    dimension = DEFAULT_DIMENSION
+    region_path = ROOT_REGION_PATH
+    selectors = []
+    for term in terms[1:]:
+        if term.replace(' ', '').startswith('region='):
+            region_path = normalise_region_path(term.split('=', 1)[1])
+        elif term.replace(' ', '').startswith('dim='):
+            value = term.split('=', 1)[1].strip()
+            if not (value.isdigit() and int(value) in DIMENSIONS):
+                raise ValueError('Dimension {0} is not valid in rule "{1}"'.format(value, group_item))
+            dimension = int(value)
+        elif term:
+            selectors.append(parse_selector(term))
+    condition = _combine(Or, selectors) if selectors else None
+    return GroupRule(terms[0], dimension, condition, ', '.join(terms), region_path)
+
+
+class BoundPlan(object):
+    """
+    Zinc fields for the conditions of a GroupRulePlan in one field module.
+    Each distinct subexpression is built once and shared.
+
+    With a FaceClassification of one mesh, atoms are built from its flag groups
+    rather than from the exterior and face fields, so the conditions are only
+    valid on that mesh.
+    """
+
+    def __init__(self, field_module, conditions, classification=None):
+        self._field_module = field_module
+        self._classification = classification
+        self._fields = {}
+        self._removal_conditions = {}
+        self.is_exterior = field_module.createFieldIsExterior()
+        for condition in conditions:
+            self.get_condition(condition)
+
+    def _build(self, node):
+        field_module = self._field_module
+        if isinstance(node, Atom):
+            if self._classification is not None:
+                mask = node.get_flags()
+                flag_groups = [self._classification.get_flag_group(flag)
+                               for flag in [FACE_EXTERIOR] + list(FACE_TYPE_FLAGS.values()) if mask & flag]
+                field = flag_groups[0]
+                for flag_group in flag_groups[1:]:
+                    field = field_module.createFieldAnd(field, flag_group)
+                return field
+            if node.name == 'exterior':
+                return self.is_exterior
+            if node.name == 'inner':
+                return field_module.createFieldAnd(self.is_exterior, self.get_condition(Atom('xi3_0')))
+            if node.name == 'outer':
+                return field_module.createFieldAnd(self.is_exterior, self.get_condition(Atom('xi3_1')))
+            return field_module.createFieldIsOnFace(FACE_TYPE_ATOMS[node.name])
+        if isinstance(node, InGroup):
+            group = field_module.findFieldByName(node.group_name).castGroup()
+            if not group.isValid():
+                raise KeyError('Group {} is not in the scaffold'.format(node.group_name))
+            return group
+        if isinstance(node, Not):
+            return field_module.createFieldNot(self.get_condition(node.child))
+        combine = field_module.createFieldAnd if isinstance(node, And) else field_module.createFieldOr
+        field = self.get_condition(node.children[0])
+        for child in node.children[1:]:
+            field = combine(field, self.get_condition(child))
+        return field
+
+    def get_condition(self, condition):
+        field = self._fields.get(condition.key)
+        if field is None:
+            field = self._build(condition)
+            self._fields[condition.key] = field
+        return field
+
+    def get_removal_condition(self, condition):
+        """
+        Get the negated condition, built on first use.
+        """
+        removal_condition = self._removal_conditions.get(condition.key)
+        if removal_condition is None:
+            removal_condition = self._field_module.createFieldNot(self.get_condition(condition))
+            self._removal_conditions[condition.key] = removal_condition
+        return removal_condition
+
+
+class GroupRulePlan(object):
+
+    def __init__(self, rules):
+        self.rules = rules
+        conditions = {}
+        for rule in rules:
+            if rule.condition:
+                conditions.setdefault(rule.condition.key, rule.condition)
+        self.conditions = list(conditions.values())
+
+    def get_flags(self, dimension):
+        """
+        Get the classification flags needed by the rules of dimension.
+        """
+        flags = 0
+        for rule in self.rules:
+            if rule.condition and (rule.dimension == dimension):
+                flags |= rule.condition.get_flags()
+        return flags
+
+    def get_rule_sets(self, rules=None):
+        """
+        Split the rules into the smallest sets sharing no group, keeping each set
+        in rule order, since a rule selecting "in" a group must run after the
+        rules trimming that group.  Sets can be applied independently.
+
+        :param rules: Subset of the plan's rules to split, by default all of them.
+        :return: List of lists of GroupRule.
+        """
+        rules = self.rules if rules is None else rules
+        set_of = {}
+        rule_sets = []
+        for rule in rules:
+            group_names = [rule.group_name] + (rule.condition.get_group_names() if rule.condition else [])
+            merged = {'rules': [], 'group_names': set()}
+            for rule_set in {id(set_of[name]): set_of[name] for name in group_names if name in set_of}.values():
+                merged['rules'].extend(rule_set['rules'])
+                merged['group_names'].update(rule_set['group_names'])
+                rule_sets.remove(rule_set)
+            merged['rules'].append(rule)
+            merged['group_names'].update(group_names)
+            for name in merged['group_names']:
+                set_of[name] = merged
+            rule_sets.append(merged)
+        order = {id(rule): index for index, rule in enumerate(rules)}
+        return [sorted(rule_set['rules'], key=lambda rule: order[id(rule)]) for rule_set in rule_sets]
+
+    def get_group_names(self):
+        """
+        Get the names of all groups the rules trim or select from, in order.
+        """
+        names = []
+        for rule in self.rules:
+            for name in [rule.group_name] + (rule.condition.get_group_names() if rule.condition else []):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def get_region_rules(self, region_path):
+        return [rule for rule in self.rules if rule.applies_to(region_path)]
+
+    def bind(self, field_module, conditions=None, classification=None):
+        """
+        Build the fields for conditions, by default all of the plan's, in field_module.
+        Other conditions are built when first used.
+
+        :param classification: Optional FaceClassification whose flag groups give the atoms.
+        """
+        return BoundPlan(field_module, self.conditions if conditions is None else conditions, classification)
+
+
+@lru_cache(maxsize=32)
+def _compile_rules(group_items):
+    return GroupRulePlan([parse_rule(group_item) for group_item in group_items if group_item.strip()])
+
+
+def compile_rules(group_item_list):
+    """
+    Compile a list of rule strings into a GroupRulePlan, validating them without
+    needing the scaffold. Plans are cached so an unchanged rule list is only
+    compiled once per session.
+    """
+    return _compile_rules(tuple(group_item_list))
@@ -0,0 +1,885 @@
+"""
+Scaffold group manager engine, with no Qt or MAP Client dependencies.
+
+NOTE: This plugin, although may work for any scaffold, is written specifically for the heart scaffold.
+In future, we may need to generalize it for other scaffolds.
+"""
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from opencmiss.zinc.context import Context
+from opencmiss.zinc.field import Field, FieldGroup
+from opencmiss.zinc.result import RESULT_OK
+from opencmiss.utils.zinc.general import ChangeManager
+
+from mapclientplugins.scaffoldgroupmanagerstep.bounded import plan_chunks
+from mapclientplugins.scaffoldgroupmanagerstep.cache import hash_file
+from mapclientplugins.scaffoldgroupmanagerstep.classification import ALL_FLAGS, FaceClassification, remove_faces, \
+    remove_nodes, remove_unmatched_elements, remove_unmatched_nodes
+from mapclientplugins.scaffoldgroupmanagerstep.inputfile import MappedInputFile
+from mapclientplugins.scaffoldgroupmanagerstep.incremental import RegroupState, get_rule_set_key
+from mapclientplugins.scaffoldgroupmanagerstep.output import OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP, \
+    OUTPUT_FORMAT_GROUPS_DELTA, OUTPUT_FORMAT_EX_SHARDS, SIDECAR_EXTENSION, MANIFEST_EXTENSION, get_domain_name, \
+    get_group_membership_arrays, make_output_description, output_file_name, rewrite_group_membership, \
+    write_region, write_region_to_buffer, write_binary_sidecar, write_groups_delta, write_delta_manifest
+from mapclientplugins.scaffoldgroupmanagerstep.preflight import check_rules, preflight
+from mapclientplugins.scaffoldgroupmanagerstep.profiling import RegroupReport, get_current_rss
+from mapclientplugins.scaffoldgroupmanagerstep.reader import LAZY_DOMAIN_TYPES, read_region_restricted
+from mapclientplugins.scaffoldgroupmanagerstep.sharded import write_region_shards
+from mapclientplugins.scaffoldgroupmanagerstep.rules import ALL_REGIONS, ROOT_REGION_PATH, compile_rules
+
+
+DEFAULT_COORDINATES_FIELD_NAME = 'coordinates'
+
+# Domain of the members trimmed by rules of each dimension, for the groups delta.
+DIMENSION_DOMAINS = {
+    0: (Field.DOMAIN_TYPE_NODES, 'nodes'),
+    1: (Field.DOMAIN_TYPE_MESH1D, 'mesh1d'),
+    2: (Field.DOMAIN_TYPE_MESH2D, 'mesh2d'),
+}
+
+# Coordinate field names found per scaffold schema fingerprint, shared by all managers in this process.
+_coordinate_field_names = {}
+
+
+class RegroupCancelled(Exception):
+    """
+    Raised by a manager cancelled between groups or before save.
+    """
+
+
+def iterate_regions(region, path=ROOT_REGION_PATH):
+    """
+    Yield (path, region) for region and all its descendants, depth first.
+    """
+    yield path, region
+    child = region.getFirstChild()
+    while child.isValid():
+        for descendant in iterate_regions(child, path.rstrip('/') + '/' + child.getName()):
+            yield descendant
+        child = child.getNextSibling()
+
+
+def get_group_label(region_path, group_name):
+    """
+    Get the name of a group qualified by its region path, if not the root region.
+    """
+    return group_name if region_path == ROOT_REGION_PATH else region_path + '/' + group_name
+
+
+class _RegionState(object):
+    """
+    The state a ScaffoldGroupManager keeps for each region of the scaffold.
+    """
+
+    def __init__(self, region):
+        self.region = region
+        self.field_module = region.getFieldmodule()
+        self.removed_identifiers = {}
+        self.bound_plan = None
+
+
+class ScaffoldGroupManager(object):
+    """
+    Applies group rules to a scaffold and saves the result.
+
+    The scaffold's region tree is read into one context. Rules apply to the
+    region of their region=PATH term, the root region by default. The compiled
+    plan is shared by all regions, and each region keeps its own bound field
+    graph and removed members. While rules are applied the
+    per-region attributes below refer to the region being processed, and
+    otherwise to the root region.
+    """
+
+    def __init__(self, input_scaffold_file, groups, classify_faces=True, output_format=OUTPUT_FORMAT_EX,
+                 binary_sidecar=False, lazy_load=False, coordinates_field_name=None, profile=False,
+                 memory_output=False, run_preflight=True, memory_budget=0, state_file=None,
+                 progress_callback=None, rebuild_subelements=False, shard_processes=1):
+        if lazy_load and (output_format != OUTPUT_FORMAT_GROUPS_DELTA):
+            raise ValueError("Lazy loading only reads the fields the rules need, "
+                             "so it requires the '{}' output format".format(OUTPUT_FORMAT_GROUPS_DELTA))
+        if memory_output and (output_format not in (OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP)):
+            raise ValueError("Memory output holds the regrouped scaffold as EX bytes, so it requires the '{0}' or "
+                             "'{1}' output format".format(OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP))
+        if memory_budget and ((output_format not in (OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP)) or
+                              lazy_load or binary_sidecar or memory_output):
+            raise ValueError("A memory budget streams the output from the input file, so it requires the '{0}' or "
+                             "'{1}' output format without a sidecar or memory output".format(
+                                 OUTPUT_FORMAT_EX, OUTPUT_FORMAT_EX_GZIP))
+        self._context = Context('ScaffoldGroupManager')
+        self._region = self._context.createRegion()
+        self._region.setName('GroupManagerRegion')
+        self._region_states = {ROOT_REGION_PATH: _RegionState(self._region)}
+        self._current_state = self._region_states[ROOT_REGION_PATH]
+        self._scaffold_file = input_scaffold_file
+        self._model_coordinates_field = None
+        self._output_filename = None
+        self._sidecar_filename = None
+        self._manifest_filename = None
+        self._shard_filenames = None
+        self._groups = groups
+        self._classify_faces = classify_faces
+        self._output_format = output_format
+        self._binary_sidecar = binary_sidecar
+        self._lazy_load = lazy_load
+        self._coordinates_field_name = coordinates_field_name
+        self._loaded_mtime = None
+        self._profile = profile
+        self._load_report = RegroupReport(profile)
+        self._report = RegroupReport(profile, self._load_report)
+        self._memory_output = memory_output
+        self._output_buffer = None
+        self._run_preflight = run_preflight
+        self._memory_budget = memory_budget
+        self._header = None
+        self._source_digest = None
+        self._state_file = state_file
+        self._progress_callback = progress_callback
+        self._cancel_event = threading.Event()
+        self._rebuild_subelements = rebuild_subelements
+        self._shard_processes = shard_processes
+        self._input_file = None
+
+    @property
+    def _field_module(self):
+        return self._current_state.field_module
+
+    @property
+    def _removed_identifiers(self):
+        return self._current_state.removed_identifiers
+
+    @_removed_identifiers.setter
+    def _removed_identifiers(self, removed_identifiers):
+        self._current_state.removed_identifiers = removed_identifiers
+
+    @property
+    def _bound_plan(self):
+        return self._current_state.bound_plan
+
+    @_bound_plan.setter
+    def _bound_plan(self, bound_plan):
+        self._current_state.bound_plan = bound_plan
+
+    def _select_region(self, region_path):
+        self._current_state = self._region_states[region_path]
+
+    def _find_region_states(self):
+        """
+        Create the state of each region in the loaded tree, keeping the root's.
+        """
+        root_state = _RegionState(self._region)
+        self._region_states = {ROOT_REGION_PATH: root_state}
+        for region_path, region in iterate_regions(self._region):
+            if region_path != ROOT_REGION_PATH:
+                self._region_states[region_path] = _RegionState(region)
+        self._current_state = root_state
+
+    def get_region_paths(self):
+        """
+        Get the paths of the regions of the loaded scaffold, the root region first.
+        """
+        return list(self._region_states)
+
+    def load(self, group_item_list=None):
+        """
+        Read the scaffold into the manager's region, if not already loaded.
+        Unless disabled, the rules are first checked against the file headers,
+        raising ValueError before the full load if a group or field is missing.
+        With a memory budget only the headers are read here; each chunk of rules
+        reads its own region when applied.
+
+        :param group_item_list: Rules to check, defaults to the rules the manager was created with.
+        """
+        if self._loaded_mtime is None:
+            self._load_report = RegroupReport(self._profile)
+            self._report.load_report = self._load_report
+            self._source_digest = None
+            if self._run_preflight or self._memory_budget:
+                self._report_progress('preflight')
+                with self._open_input() as input_file:
+                    self._header = self.preflight(input_file, group_item_list).header
+            if not self._memory_budget:
+                self._report_progress('load')
+                with self._load_report.phase('load'):
+                    self._load()
+            self._load_report.add_file_read(self._scaffold_file)
+            self._loaded_mtime = os.stat(self._scaffold_file).st_mtime_ns
+
+    def set_input_file(self, input_file):
+        """
+        :param input_file: Open MappedInputFile of the scaffold file, scanned by
+        the next preflight instead of mapping the file again, or None. The caller keeps it
+        open until the load is done and closes it.
+        """
+        self._input_file = input_file
+
+    @contextmanager
+    def _open_input(self):
+        """
+        Yield the MappedInputFile set for the scaffold, or one mapped for the
+        duration of the with block.
+        """
+        if self._input_file is not None:
+            yield self._input_file
+            return
+        with MappedInputFile(self._scaffold_file) as input_file:
+            self._input_file = input_file
+            try:
+                yield input_file
+            finally:
+                self._input_file = None
+
+    def is_loaded_from(self, input_scaffold_file):
+        """
+        Return True if the region holds input_scaffold_file, unchanged on disk since it was loaded.
+        """
+        return (self._loaded_mtime is not None) and (input_scaffold_file == self._scaffold_file) and \
+            os.path.isfile(input_scaffold_file) and (os.stat(input_scaffold_file).st_mtime_ns == self._loaded_mtime)
+
+    def apply(self, group_item_list=None):
+        """
+        Apply group rules to the groups as loaded, undoing any previous apply.
+        With a state file, sets of rules unchanged since the run that wrote it,
+        on unchanged groups, reuse its results rather than being recomputed.
+
+        :param group_item_list: List of "group, term, ..." rules (see rules.py),
+        defaults to the rules the manager was created with.
+        """
+        # A run starts here: a cancel left over from an earlier run must not stop it.
+        self._cancel_event.clear()
+        self._report = RegroupReport(self._profile, self._load_report)
+        if group_item_list is None:
+            group_item_list = self._groups.get("groups", [])
+        # Rule syntax errors raise here, before the scaffold is loaded.
+        compile_rules(group_item_list)
+        if self._header is not None:
+            # The headers were scanned by an earlier load, possibly for other rules.
+            coordinates_field_name = self._get_required_coordinates_field_name()
+            with self._report.phase('preflight'):
+                preflight_report = check_rules(self._header, group_item_list, coordinates_field_name)
+            self._report.preflight = preflight_report.to_dict()
+            self._check_preflight_report(preflight_report)
+        self.load(group_item_list)
+        self.reset()
+        with self._report.phase('manage_groups'):
+            if self._memory_budget:
+                self._manage_groups_bounded(group_item_list)
+            else:
+                self._manage_groups(group_item_list)
+                if self._rebuild_subelements:
+                    self._check_cancelled()
+                    self._report_progress('rebuild_subelements')
+                    with self._report.phase('rebuild_subelements'):
+                        self._trim_subelements()
+        self._report.removed_counts = self.get_removed_counts()
+
+    def preflight(self, input_file=None, group_item_list=None):
+        """
+        Check the rules against the headers of the scaffold file without loading it.
+
+        :param input_file: Optional open MappedInputFile of the scaffold file.
+        :param group_item_list: Rules to check, defaults to the rules the manager was created with.
+
+        :return: PreflightReport, also recorded in the load report.
+        """
+        if group_item_list is None:
+            group_item_list = self._groups.get("groups", [])
+        coordinates_field_name = self._get_required_coordinates_field_name()
+        with self._load_report.phase('preflight'):
+            preflight_report = preflight(self._scaffold_file, group_item_list, coordinates_field_name, input_file)
+        self._load_report.preflight = preflight_report.to_dict()
+        self._check_preflight_report(preflight_report)
+        return preflight_report
+
+    def _get_required_coordinates_field_name(self):
+        return self._coordinates_field_name or \
+            (DEFAULT_COORDINATES_FIELD_NAME if (self._lazy_load or self._memory_budget) else None)
+
+    def _check_preflight_report(self, preflight_report):
+        for warning in preflight_report.warnings:
+            print('Warning:', warning)
+        if not preflight_report.succeeded():
+            raise ValueError('Preflight failed: ' + '; '.join(preflight_report.errors))
+
+    def set_progress_callback(self, progress_callback):
+        """
+        :param progress_callback: Function of (phase, done, total, detail) called at the
+        start of each phase and before each group, chunk or file is processed. It is
+        called on the thread running the manager.
+        """
+        self._progress_callback = progress_callback
+
+    def cancel(self):
+        """
+        Request the running apply or save to stop, raising RegroupCancelled at the
+        next group or before saving. A request still pending when the next apply
+        starts is discarded. Safe to call from any thread.
+        """
+        self._cancel_event.set()
+
+    def _check_cancelled(self):
+        if self._cancel_event.is_set():
+            self._cancel_event.clear()
+            raise RegroupCancelled('Regroup of {0} was cancelled'.format(self._scaffold_file))
+
+    def _report_progress(self, phase, done=0, total=1, detail=''):
+        if self._progress_callback:
+            self._progress_callback(phase, done, total, detail)
+
+    def save(self):
+        self._check_cancelled()
+        self._report_progress('save')
+        with self._report.phase('save'):
+            self._save()
+        for file_name in [self._output_filename, self._sidecar_filename, self._manifest_filename] + \
+                (self._shard_filenames or []):
+            self._report.add_file_written(file_name)
+        return self._output_filename
+
+    def get_report(self):
+        """
+        Get the RegroupReport of timings and sizes of the last apply and save.
+        """
+        return self._report
+
+    def reset(self):
+        """
+        Restore the faces, lines and nodes removed by the last apply, returning the
+        groups to their loaded membership without reading the file again.
+        """
+        for region_path in self._region_states:
+            self._select_region(region_path)
+            if self._removed_identifiers and not self._memory_budget:
+                with self._report.phase('reset'), ChangeManager(self._field_module):
+                    for (group_name, dimension), identifiers in self._removed_identifiers.items():
+                        if dimension == 0:
+                            nodeset_group = self._get_nodeset_group(group_name)
+                            nodes = nodeset_group.getMasterNodeset()
+                            for identifier in identifiers:
+                                nodeset_group.addNode(nodes.findNodeByIdentifier(identifier))
+                        else:
+                            term_mesh_group = self._get_mesh_group(group_name, dimension)
+                            mesh = term_mesh_group.getMasterMesh()
+                            for identifier in identifiers:
+                                term_mesh_group.addElement(mesh.findElementByIdentifier(identifier))
+            self._removed_identifiers = {}
+        self._select_region(ROOT_REGION_PATH)
+
+    def _iterate_removed_identifiers(self):
+        """
+        Yield (region path, group name, dimension, identifiers) removed by the last apply, in all regions.
+        """
+        for region_path, state in self._region_states.items():
+            for (group_name, dimension), identifiers in state.removed_identifiers.items():
+                yield region_path, group_name, dimension, identifiers
+
+    def _discover_coordinate_fields(self):
+        field = None
+        if self._model_coordinates_field:
+            field = self._field_module.findFieldByName(self._model_coordinates_field)
+        elif self._coordinates_field_name:
+            field = self._field_module.findFieldByName(self._coordinates_field_name)
+            if not field.isValid():
+                print('Warning: Did not find coordinates field', self._coordinates_field_name)
+                field = None
+        else:
+            fingerprint = self._get_schema_fingerprint()
+            field_name = _coordinate_field_names.get(fingerprint) if fingerprint else None
+            if field_name:
+                field = self._field_module.findFieldByName(field_name)
+            else:
+                field = self._find_coordinate_field()
+                if field and fingerprint:
+                    _coordinate_field_names[fingerprint] = field.getName()
+        if field:
+            self._set_model_coordinates_field(field)
+
+    def _get_schema_fingerprint(self):
+        """
+        Get the field names and sizes identifying the scaffold layout from the
+        preflight header, already read, or None if preflight did not run.
+        """
+        header = self._header
+        if header is None:
+            return None
+        return tuple(sorted(header.field_names)), header.node_count, tuple(sorted(header.element_counts.items()))
+
+    def _find_coordinate_field(self):
+        mesh = self._get_highest_dimension_mesh()
+        element = mesh.createElementiterator().next()
+        if element.isValid():
+            field_cache = self._field_module.createFieldcache()
+            field_cache.setElement(element)
+            fielditer = self._field_module.createFielditerator()
+            field = fielditer.next()
+            while field.isValid():
+                if field.isTypeCoordinate() and (field.getNumberOfComponents() == 3) \
+                        and (field.castFiniteElement().isValid()):
+                    if field.isDefinedAtLocation(field_cache):
+                        return field
+                field = fielditer.next()
+        return None
+
+    def _get_highest_dimension_mesh(self):
+        for d in range(2, -1, -1):
+            mesh = self._mesh[d]
+            if mesh.getSize() > 0:
+                return mesh
+        return None
+
+    def get_output_file_name(self):
+        return self._output_filename
+
+    def get_output_buffer(self):
+        """
+        Get the regrouped scaffold as EX bytes, if saved with memory_output.
+        Read it into a region with reader.read_region_from_buffer.
+        """
+        return self._output_buffer
+
+    def get_sidecar_file_name(self):
+        return self._sidecar_filename
+
+    def get_output_description(self):
+        return make_output_description(self._output_format, self._output_filename, self._sidecar_filename,
+                                       self._manifest_filename, self._shard_filenames)
+
+    def get_removed_counts(self):
+        """
+        Get the number of faces, lines or nodes removed from each group by the last
+        regroup, labelled by group name qualified by its region path if not the root,
+        with the dimension if not faces.
+        """
+        counts = {}
+        for region_path, group_name, dimension, identifiers in self._iterate_removed_identifiers():
+            label = get_group_label(region_path, group_name)
+            counts[label if dimension == 2 else '{0} (dim={1})'.format(label, dimension)] = len(identifiers)
+        return counts
+
+    def get_group_memberships(self):
+        """
+        Get the member identifiers of every group before and after the last apply,
+        from the region and the removed identifiers, without writing EX.
+
+        :return: Dict of group name, qualified by its region path if not the root, to
+        {'before': arrays, 'after': arrays}, arrays being a dict of domain name (nodes,
+        mesh1d, mesh2d, mesh3d) to sorted NumPy int32 identifiers.
+        """
+        import numpy as np
+
+        self._check_region_held()
+        self.load()
+        memberships = {}
+        for region_path, state in self._region_states.items():
+            for group_name, arrays in get_group_membership_arrays(state.field_module).items():
+                memberships[get_group_label(region_path, group_name)] = {'before': dict(arrays), 'after': arrays}
+        for region_path, group_name, dimension, identifiers in self._iterate_removed_identifiers():
+            label = get_group_label(region_path, group_name)
+            if identifiers and (label in memberships):
+                before = memberships[label]['before']
+                domain_name = get_domain_name(dimension)
+                before[domain_name] = np.union1d(before.get(domain_name, np.empty(0, dtype=np.int32)),
+                                                 np.array(identifiers, dtype=np.int32)).astype(np.int32)
+        return memberships
+
+    def get_face_classification(self, dimension=2, region_path=ROOT_REGION_PATH):
+        """
+        Get the exterior, inner and outer classification of every face (or line
+        with dimension=1) of a region as a NumPy structured array, see
+        FaceClassification.to_array.
+        """
+        self._check_region_held()
+        self.load()
+        state = self._region_states[region_path]
+        with ChangeManager(state.field_module):
+            classification = FaceClassification.from_mesh(
+                state.field_module, state.field_module.findMeshByDimension(dimension), ALL_FLAGS)
+            faces = classification.to_array()
+            del classification
+        return faces
+
+    def _check_region_held(self):
+        if self._memory_budget:
+            raise ValueError('A manager with a memory budget does not hold the scaffold region')
+
+    def get_modified_group_names(self):
+        """
+        Get the names of the groups trimmed by the last apply, in any region.
+        """
+        group_names = []
+        for region_path, group_name, dimension, identifiers in self._iterate_removed_identifiers():
+            if identifiers and (group_name not in group_names):
+                group_names.append(group_name)
+        return group_names
+
+    def get_modified_dimensions(self):
+        return sorted(set(dimension for region_path, group_name, dimension, identifiers
+                          in self._iterate_removed_identifiers() if identifiers))
+
+    def _get_group(self, group_name):
+        group = self._field_module.findFieldByName(group_name).castGroup()
+        return group if group.isValid() else None
+
+    def _get_mesh_group(self, group_name, dimension):
+        term_group = self._get_group(group_name)
+        if not term_group:
+            return None
+        term_element_group = term_group.getFieldElementGroup(self._field_module.findMeshByDimension(dimension))
+        return term_element_group.getMeshGroup() if term_element_group.isValid() else None
+
+    def _get_nodeset_group(self, group_name):
+        term_group = self._get_group(group_name)
+        if not term_group:
+            return None
+        nodes = self._field_module.findNodesetByFieldDomainType(Field.DOMAIN_TYPE_NODES)
+        term_node_group = term_group.getFieldNodeGroup(nodes)
+        return term_node_group.getNodesetGroup() if term_node_group.isValid() else None
+
+    def _get_bound_plan(self, plan):
+        if (self._bound_plan is None) or (self._bound_plan[0] is not plan):
+            # Conditions are built on first use, as a region may not have every group the plan selects from.
+            self._bound_plan = (plan, plan.bind(self._field_module, []))
+        return self._bound_plan[1]
+
+    def _load(self):
+        result = None
+        if self._lazy_load:
+            result = self._load_lazy()
+        if result != RESULT_OK:
+            result = self._region.readFile(self._scaffold_file)
+        assert result == RESULT_OK, "Failed to load model file" + str(self._scaffold_file)
+        self._find_region_states()
+        self._mesh = [self._field_module.findMeshByDimension(d + 1) for d in range(3)]
+        with self._load_report.phase('discover_coordinate_fields'):
+            self._discover_coordinate_fields()
+
+    def _load_lazy(self):
+        """
+        Read only the groups referenced by the rules and the coordinates field
+        giving the element connectivity, skipping all other fields and mesh1d
+        unless a rule trims lines or the lines are rebuilt after trimming faces.
+        """
+        plan = compile_rules(self._groups.get("groups", []))
+        domain_types = LAZY_DOMAIN_TYPES
+        if self._rebuild_subelements or any(rule.dimension == 1 for rule in plan.rules):
+            domain_types |= Field.DOMAIN_TYPE_MESH1D
+        coordinates_field_name = self._coordinates_field_name or DEFAULT_COORDINATES_FIELD_NAME
+        result = read_region_restricted(self._region, self._scaffold_file,
+                                        plan.get_group_names() + [coordinates_field_name], domain_types)
+        if result == RESULT_OK:
+            self._model_coordinates_field = coordinates_field_name
+        else:
+            print('Warning: Restricted read failed, reading the whole file', self._scaffold_file)
+            # Start again from an empty region before the full read.
+            self._region = self._context.createRegion()
+            self._region.setName('GroupManagerRegion')
+        return result
+
+    def _save(self):
+        filename = os.path.basename(self._scaffold_file).split('.')[0] + '_regrouped'
+        path = os.path.dirname(self._scaffold_file)
+        base_name = os.path.join(path, filename)
+        self._output_filename = output_file_name(base_name, self._output_format)
+        if self._memory_budget:
+            rewrite_group_membership(self._scaffold_file, self._output_filename, self._removed_identifiers)
+        elif self._output_format == OUTPUT_FORMAT_GROUPS_DELTA:
+            group_names = self.get_modified_group_names()
+            dimensions = self.get_modified_dimensions() or [2]
+            domain_types = 0
+            for dimension in dimensions:
+                domain_types |= DIMENSION_DOMAINS[dimension][0]
+            write_groups_delta(self._region, self._output_filename, group_names, domain_types)
+            self._manifest_filename = base_name + '.' + MANIFEST_EXTENSION
+            write_delta_manifest(self._manifest_filename, self._scaffold_file, self._output_filename, group_names,
+                                 [DIMENSION_DOMAINS[dimension][1] for dimension in dimensions])
+        elif self._output_format == OUTPUT_FORMAT_EX_SHARDS:
+            self._shard_filenames = write_region_shards(self._region, self._output_filename, self._shard_processes)
+        elif self._memory_output:
+            # Serialise once into memory, publish the buffer and save the same bytes to file.
+            self._output_buffer = write_region_to_buffer(self._region)
+            write_region(self._region, self._output_filename, self._output_format, self._output_buffer)
+        else:
+            write_region(self._region, self._output_filename, self._output_format)
+        if self._binary_sidecar:
+            self._sidecar_filename = base_name + '.' + SIDECAR_EXTENSION
+            write_binary_sidecar(self._field_module, self._model_coordinates_field, self._sidecar_filename)
+
+    def _manage_groups(self, group_item_list):
+        plan = compile_rules(group_item_list)
+        state = RegroupState(self._state_file) if self._state_file else None
+        rule_set_keys = []
+        for rule in plan.rules:
+            if (rule.region_path != ALL_REGIONS) and (rule.region_path not in self._region_states):
+                print('Warning: Did not find region', rule.region_path, 'for group', rule.group_name)
+        for region_path in self._region_states:
+            self._select_region(region_path)
+            try:
+                # Rules for all regions only apply where the group exists.
+                rules = [rule for rule in plan.get_region_rules(region_path)
+                         if (rule.region_path != ALL_REGIONS) or self._get_group(rule.group_name)]
+                if rules:
+                    rule_set_keys.extend(self._manage_region_groups(plan, rules, region_path, state))
+            finally:
+                self._select_region(ROOT_REGION_PATH)
+        if state:
+            state.write(rule_set_keys)
+
+    def _manage_region_groups(self, plan, rules, region_path, state):
+        """
+        Apply rules to the groups of the selected region, reusing results from state if given.
+
+        :return: List of the keys of the region's rule sets in state.
+        """
+        rule_set_keys = []
+        stale_rule_sets = []
+        with ChangeManager(self._field_module):
+            if state:
+                # Keys are computed from the source membership before any set is trimmed.
+                for rule_set in plan.get_rule_sets(rules):
+                    key = get_rule_set_key(rule_set, self._get_membership_digest(region_path, rule_set))
+                    rule_set_keys.append(key)
+                    removed_identifiers = state.get(key)
+                    if removed_identifiers is None:
+                        stale_rule_sets.append((key, rule_set))
+                    else:
+                        self._remove_identifiers(removed_identifiers)
+                        for rule in rule_set:
+                            label = get_group_label(region_path, rule.group_name)
+                            if label not in self._report.reused_groups:
+                                self._report.reused_groups.append(label)
+                stale_rules = set(id(rule) for key, rule_set in stale_rule_sets for rule in rule_set)
+                rules = [rule for rule in rules if id(rule) in stale_rules]
+            self._apply_rules(plan, rules)
+        if state:
+            for key, rule_set in stale_rule_sets:
+                state.put(key, {(rule.group_name, rule.dimension):
+                                self._removed_identifiers.get((rule.group_name, rule.dimension), [])
+                                for rule in rule_set})
+        return rule_set_keys
+
+    def _get_membership_digest(self, region_path, rules):
+        """
+        Hash the source membership of every group the rules trim or select from without
+        visiting any member: reset restores the groups to their membership in the scaffold
+        file, so the file contents fix it, with the loaded mesh and group sizes guarding
+        against a partial or lazy load.
+        """
+        digest = hashlib.sha256()
+        digest.update(self._get_source_digest().encode())
+        digest.update(region_path.encode())
+        digest.update(str([self._field_module.findMeshByDimension(d).getSize() for d in range(1, 4)]).encode())
+        group_names = set(name for rule in rules
+                          for name in [rule.group_name] + (rule.condition.get_group_names() if rule.condition else []))
+        for group_name in sorted(group_names):
+            nodeset_group = self._get_nodeset_group(group_name)
+            sizes = [nodeset_group.getSize() if nodeset_group else 0]
+            for dimension in (1, 2):
+                mesh_group = self._get_mesh_group(group_name, dimension)
+                sizes.append(mesh_group.getSize() if mesh_group else 0)
+            digest.update(json.dumps([group_name, sizes]).encode())
+        return digest.hexdigest()
+
+    def _get_source_digest(self):
+        """
+        Hex sha256 of the loaded scaffold file, taken from the mapped input file if set
+        so it is shared with the output cache key, and kept until the next load.
+        """
+        if self._source_digest is None:
+            self._source_digest = self._input_file.get_hexdigest() if self._input_file \
+                else hash_file(self._scaffold_file)
+        return self._source_digest
+
+    def _remove_identifiers(self, removed_identifiers):
+        """
+        Remove stored members from the groups, as a previous apply did.
+
+        :param removed_identifiers: Dict of (group name, dimension) to identifiers.
+        """
+        for (group_name, dimension), identifiers in removed_identifiers.items():
+            if not identifiers:
+                continue
+            if dimension == 0:
+                remove_nodes(self._field_module, self._get_nodeset_group(group_name), identifiers)
+            else:
+                remove_faces(self._field_module, self._get_mesh_group(group_name, dimension), identifiers)
+            self._removed_identifiers.setdefault((group_name, dimension), []).extend(identifiers)
+
+    def _apply_rules(self, plan, rules):
+        """
+        Trim the groups of the selected region by rules in order, each in bulk inside Zinc.
+        With classify_faces the atoms are flag groups of each mesh, classified once for
+        all rules and released after them; otherwise every rule evaluates the exterior
+        and face fields.
+
+        Rules are not split across processes: a Zinc region cannot be shared between
+        them, so each worker would read and classify the whole mesh again, which costs
+        more than all the rules take once classified. batch.py runs files in parallel.
+        """
+        bound_plans = {}
+        if self._classify_faces:
+            self._report_progress('classify_faces')
+            with self._report.phase('classify_faces'):
+                for dimension in (1, 2):
+                    # dim=0 rules keep the nodes of the faces satisfying their condition.
+                    flags = 0
+                    for rule in rules:
+                        if rule.condition and ((rule.dimension or 2) == dimension):
+                            flags |= rule.condition.get_flags()
+                    if flags:
+                        classification = FaceClassification.from_mesh(
+                            self._field_module, self._field_module.findMeshByDimension(dimension), flags)
+                        bound_plans[dimension] = plan.bind(self._field_module, [], classification)
+        for index, rule in enumerate(rules):
+            self._check_cancelled()
+            self._report_progress('manage_groups', index, len(rules), rule.group_name)
+            print(rule)
+            if rule.condition is None:
+                print('Warning: No surface condition for group', rule.group_name)
+                continue
+            bound_plan = bound_plans.get(rule.dimension or 2) or self._get_bound_plan(plan)
+            if rule.dimension == 0:
+                self._trim_nodes(bound_plan, rule)
+                continue
+            term_mesh_group = self._get_mesh_group(rule.group_name, rule.dimension)
+            if not term_mesh_group:
+                print('Warning: Did not find {0} group'.format('face' if rule.dimension == 2 else 'line'),
+                      rule.group_name)
+                continue
+            removed = remove_unmatched_elements(self._field_module, self._get_group(rule.group_name),
+                                                term_mesh_group, bound_plan.get_removal_condition(rule.condition))
+            self._removed_identifiers.setdefault((rule.group_name, rule.dimension), []).extend(removed)
+
+    def _manage_groups_bounded(self, group_item_list):
+        """
+        Apply the rules in chunks estimated to fit the memory budget, each read
+        lazily into its own manager and freed before the next.  Each chunk reads
+        the whole mesh and coordinates again and only the groups are split (see
+        bounded.py).  Raises MemoryError if a chunk cannot fit the estimated
+        budget, or if a chunk grew the process by more than the budget once it has run.
+
+        The growth of each chunk is measured from the resident size before it
+        starts, so memory the allocator keeps after earlier chunks is not counted
+        against later ones. It is an after the fact check, not a limit: a chunk
+        reusing memory freed by earlier chunks may appear to grow less than it
+        used, and where only the peak size can be read, growth below an earlier
+        peak is not seen.
+        """
+        if any(rule.region_path != ROOT_REGION_PATH for rule in compile_rules(group_item_list).rules):
+            raise ValueError('A memory budget only regroups the root region')
+        if self._header.version is None or self._header.version < 2:
+            raise ValueError('A memory budget requires EX version 2 or later, which lists group members by '
+                             'identifier: ' + self._scaffold_file)
+        chunks = plan_chunks(compile_rules(group_item_list), self._header, self._memory_budget,
+                             with_lines=self._rebuild_subelements)
+        self._report.memory_budget = self._memory_budget
+        self._report.chunk_memory = []
+        for index, rules in enumerate(chunks):
+            self._check_cancelled()
+            self._report_progress('chunk', index, len(chunks), ', '.join(rule.group_name for rule in rules))
+            baseline_rss = get_current_rss()
+            with self._report.phase('chunk'):
+                manager = ScaffoldGroupManager(
+                    self._scaffold_file, {"groups": [rule.text for rule in rules]},
+                    classify_faces=self._classify_faces, output_format=OUTPUT_FORMAT_GROUPS_DELTA, lazy_load=True,
+                    coordinates_field_name=self._coordinates_field_name, run_preflight=False,
+                    rebuild_subelements=self._rebuild_subelements)
+                manager.apply()
+                # RSS cannot be read on every platform, and the budget is then only estimated.
+                chunk_memory = None if baseline_rss is None else get_current_rss() - baseline_rss
+                for key, identifiers in manager._removed_identifiers.items():
+                    self._removed_identifiers.setdefault(key, []).extend(identifiers)
+                self._report.subelement_counts.update(manager.get_report().subelement_counts)
+                del manager
+            self._report.chunk_memory.append(chunk_memory)
+            if (chunk_memory is not None) and (chunk_memory > self._memory_budget):
+                raise MemoryError('A chunk of the regroup of {0} grew the process by {1:.1f} MB, over the budget '
+                                  'of {2:.1f} MB'.format(self._scaffold_file, chunk_memory / 1024 ** 2,
+                                                         self._memory_budget / 1024 ** 2))
+
+    def _trim_subelements(self):
+        """
+        Trim the lines and nodes of each group whose faces were trimmed to the
+        closure of its remaining faces, recording them as removed and their counts
+        before and after in the report.  Each group's closure is built by Zinc in a
+        temporary group, and the group's own lines and nodes outside it are removed.
+        """
+        for region_path in self._region_states:
+            self._select_region(region_path)
+            group_names = [group_name for (group_name, dimension), identifiers in self._removed_identifiers.items()
+                           if (dimension == 2) and identifiers]
+            if not group_names:
+                continue
+            field_module = self._field_module
+            mesh2d = field_module.findMeshByDimension(2)
+            with ChangeManager(field_module):
+                for group_name in group_names:
+                    term_group = self._get_group(group_name)
+                    keep_group = field_module.createFieldGroup()
+                    keep_group.setSubelementHandlingMode(FieldGroup.SUBELEMENT_HANDLING_MODE_FULL)
+                    keep_group.createFieldElementGroup(mesh2d).getMeshGroup().addElementsConditional(term_group)
+                    not_kept = field_module.createFieldNot(keep_group)
+                    counts = {}
+                    term_mesh_group = self._get_mesh_group(group_name, 1)
+                    if term_mesh_group:
+                        before = term_mesh_group.getSize()
+                        removed = remove_unmatched_elements(field_module, term_group, term_mesh_group, not_kept)
+                        counts[get_domain_name(1)] = {'before': before, 'after': term_mesh_group.getSize()}
+                        self._removed_identifiers.setdefault((group_name, 1), []).extend(removed)
+                    nodeset_group = self._get_nodeset_group(group_name)
+                    if nodeset_group:
+                        before = nodeset_group.getSize()
+                        removed = remove_unmatched_nodes(field_module, term_group, nodeset_group, not_kept)
+                        counts[get_domain_name(0)] = {'before': before, 'after': nodeset_group.getSize()}
+                        self._removed_identifiers.setdefault((group_name, 0), []).extend(removed)
+                    self._report.subelement_counts[get_group_label(region_path, group_name)] = counts
+                    del not_kept
+                    del keep_group
+        self._select_region(ROOT_REGION_PATH)
+
+    def _trim_nodes(self, bound_plan, rule):
+        """
+        Keep only the nodes of the group's faces satisfying the rule's condition,
+        found as the node closure of those faces in a temporary group.
+        """
+        nodeset_group = self._get_nodeset_group(rule.group_name)
+        if not nodeset_group:
+            print('Warning: Did not find node group', rule.group_name)
+            return
+        field_module = self._field_module
+        group = self._get_group(rule.group_name)
+        mesh2d = field_module.findMeshByDimension(2)
+        with ChangeManager(field_module):
+            face_group = field_module.createFieldGroup()
+            face_mesh_group = face_group.createFieldElementGroup(mesh2d).getMeshGroup()
+            face_mesh_group.addElementsConditional(group)
+            face_mesh_group.removeElementsConditional(bound_plan.get_removal_condition(rule.condition))
+            keep_group = field_module.createFieldGroup()
+            keep_group.setSubelementHandlingMode(FieldGroup.SUBELEMENT_HANDLING_MODE_FULL)
+            keep_group.createFieldElementGroup(mesh2d).getMeshGroup().addElementsConditional(face_group)
+            removed = remove_unmatched_nodes(field_module, group, nodeset_group,
+                                             field_module.createFieldNot(keep_group))
+            del face_mesh_group
+            del face_group
+            del keep_group
+        self._removed_identifiers.setdefault((rule.group_name, 0), []).extend(removed)
+
+    def _set_model_coordinates_field(self, model_coordinates_field: Field):
+        finite_element_field = model_coordinates_field.castFiniteElement()
+        assert finite_element_field.isValid() and (finite_element_field.getNumberOfComponents() == 3)
+        self._model_coordinates_field = finite_element_field
+
+
+def regroup_scaffold(input_scaffold_file, groups, **kwargs):
+    """
+    Load input_scaffold_file, apply the rules in groups and save the result.
+
+    :param kwargs: Keyword arguments for ScaffoldGroupManager.
+    :return: The ScaffoldGroupManager, holding the regrouped region.
+    """
+    manager = ScaffoldGroupManager(input_scaffold_file, groups, **kwargs)
+    manager.apply()
+    manager.save()
+    return manager
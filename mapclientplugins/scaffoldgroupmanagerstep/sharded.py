@@ -0,0 +1,141 @@
+"""
+Sharded output, writing the region as one EX file per domain.
+
+Each shard is the region written through a StreamInformationRegion resource
+restricted to one domain: the nodes, or the elements of one mesh dimension,
+each with the group membership of that domain. Shards are written one after
+another unless more processes are requested. Zinc objects cannot be sent to
+other processes, so on platforms that can fork each worker process inherits the
+loaded region and writes its own shard. A forked child only has the thread that
+forked it, so this is only done when no other threads are running, as from the
+command line, and never from the step's worker thread. A small json index lists the shards in
+the order they must be read, and merge_shards reassembles them into the single
+EX file on request.
+
+Usage:
+    python -m mapclientplugins.scaffoldgroupmanagerstep.sharded heart_regrouped.shards.json [heart_regrouped.exf]
+"""
+import os
+import sys
+import json
+import threading
+import multiprocessing
+
+from opencmiss.zinc.context import Context
+from opencmiss.zinc.field import Field
+from opencmiss.zinc.result import RESULT_OK
+
+SHARD_INDEX_FORMAT = 'exf-shards'
+SHARD_INDEX_SUFFIX = '.shards.json'
+# Shards in the order they are read back: elements reference nodes by identifier.
+SHARD_DOMAINS = (
+    ('nodes', Field.DOMAIN_TYPE_NODES),
+    ('mesh1d', Field.DOMAIN_TYPE_MESH1D),
+    ('mesh2d', Field.DOMAIN_TYPE_MESH2D),
+    ('mesh3d', Field.DOMAIN_TYPE_MESH3D),
+)
+
+# Region inherited by forked worker processes.
+_shard_region = None
+
+
+def _write_shard(file_name, domain_type):
+    stream_information = _shard_region.createStreaminformationRegion()
+    resource = stream_information.createStreamresourceFile(file_name)
+    stream_information.setResourceDomainTypes(resource, domain_type)
+    return _shard_region.write(stream_information)
+
+
+def _get_base_name(index_file_name):
+    if index_file_name.endswith(SHARD_INDEX_SUFFIX):
+        return index_file_name[:-len(SHARD_INDEX_SUFFIX)]
+    return os.path.splitext(index_file_name)[0]
+
+
+def get_shard_file_names(index_file_name):
+    """
+    :return: List of the shard file names for index_file_name, in read order.
+    """
+    base_name = _get_base_name(index_file_name)
+    return [base_name + '.' + domain_name + '.exf' for domain_name, _ in SHARD_DOMAINS]
+
+
+def write_region_shards(region, index_file_name, processes=1):
+    """
+    Write region as one EX shard per domain, and an index of the shards to
+    index_file_name.
+
+    :param processes: Number of forked worker processes writing the shards.
+    Shards are written serially in this process if 1, if the platform cannot
+    fork, or if other threads are running.
+    :return: List of the shard file names.
+    """
+    global _shard_region
+    shard_file_names = get_shard_file_names(index_file_name)
+    tasks = [(file_name, domain_type) for file_name, (_, domain_type) in zip(shard_file_names, SHARD_DOMAINS)]
+    processes = min(processes, len(tasks))
+    _shard_region = region
+    try:
+        if (processes > 1) and ('fork' in multiprocessing.get_all_start_methods()) and \
+                (threading.active_count() == 1):
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                results = pool.starmap(_write_shard, tasks)
+        else:
+            results = [_write_shard(*task) for task in tasks]
+    finally:
+        _shard_region = None
+    for file_name, result in zip(shard_file_names, results):
+        assert result == RESULT_OK, "Failed to write shard " + str(file_name)
+    index = {
+        'format': SHARD_INDEX_FORMAT,
+        'shards': [{'file': os.path.basename(file_name), 'domain': domain_name, 'size': os.path.getsize(file_name)}
+                   for file_name, (domain_name, _) in zip(shard_file_names, SHARD_DOMAINS)],
+    }
+    with open(index_file_name, "w") as f:
+        f.write(json.dumps(index, indent=4))
+    return shard_file_names
+
+
+def read_shard_index(index_file_name):
+    """
+    :return: List of the shard file names listed in index_file_name, in read order.
+    """
+    with open(index_file_name, "r") as f:
+        index = json.loads(f.read())
+    if index.get('format') != SHARD_INDEX_FORMAT:
+        raise ValueError("{} is not an index of scaffold shards".format(index_file_name))
+    path = os.path.dirname(index_file_name)
+    return [os.path.join(path, shard['file']) for shard in index['shards']]
+
+
+def merge_shards(index_file_name, output_file_name=None):
+    """
+    Read the shards listed in index_file_name into one region and write it as a
+    single EX file.
+
+    :param output_file_name: Defaults to the index file name with an .exf extension.
+    :return: The output file name.
+    """
+    if output_file_name is None:
+        output_file_name = _get_base_name(index_file_name) + '.exf'
+    context = Context('ScaffoldShardMerge')
+    region = context.createRegion()
+    for file_name in read_shard_index(index_file_name):
+        result = region.readFile(file_name)
+        assert result == RESULT_OK, "Failed to read shard " + str(file_name)
+    result = region.writeFile(output_file_name)
+    assert result == RESULT_OK, "Failed to write model file " + str(output_file_name)
+    return output_file_name
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 2):
+        print('Usage: python -m mapclientplugins.scaffoldgroupmanagerstep.sharded INDEX [OUTPUT]', file=sys.stderr)
+        return 2
+    print(merge_shards(*argv))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
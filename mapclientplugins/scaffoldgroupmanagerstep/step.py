@@ -1,125 +1,20 @@
 """
 MAP Client Plugin Step
-
-NOTE: This plugin, although may work for any scaffold, is written specifically for the heart scaffold.
-In future, we may need to generalize it for other scaffolds.
 """
 import os
 import json
-
-from PySide6 import QtGui
+from contextlib import nullcontext
 
 from mapclient.mountpoints.workflowstep import WorkflowStepMountPoint
-from mapclientplugins.scaffoldgroupmanagerstep.configuredialog import ConfigureDialog
-
-from opencmiss.zinc.context import Context
-from opencmiss.zinc.element import Element
-from opencmiss.zinc.field import Field, FieldGroup
-from opencmiss.zinc.result import RESULT_OK
-from opencmiss.utils.zinc.general import ChangeManager
-
-
-class ScaffoldGroupManager(object):
-
-    def __init__(self, input_scaffold_file, groups):
-        self._context = Context('ScaffoldGroupManager')
-        self._region = self._context.createRegion()
-        self._region.setName('GroupManagerRegion')
-        self._field_module = self._region.getFieldmodule()
-        self._scaffold_file = input_scaffold_file
-        self._model_coordinates_field = None
-        self._output_filename = None
-        self._groups = groups
-
-        self._load()
-        if "groups" in groups:
-            self._manage_groups(groups["groups"])
-        self._save()
-
-    def _discover_coordinate_fields(self):
-        field = None
-        if self._model_coordinates_field:
-            field = self._field_module.findFieldByName(self._model_coordinates_field)
-        else:
-            mesh = self._get_highest_dimension_mesh()
-            element = mesh.createElementiterator().next()
-            if element.isValid():
-                field_cache = self._field_module.createFieldcache()
-                field_cache.setElement(element)
-                fielditer = self._field_module.createFielditerator()
-                field = fielditer.next()
-                while field.isValid():
-                    if field.isTypeCoordinate() and (field.getNumberOfComponents() == 3) \
-                            and (field.castFiniteElement().isValid()):
-                        if field.isDefinedAtLocation(field_cache):
-                            break
-                    field = fielditer.next()
-                else:
-                    field = None
-        if field:
-            self._set_model_coordinates_field(field)
-
-    def _get_highest_dimension_mesh(self):
-        for d in range(2, -1, -1):
-            mesh = self._mesh[d]
-            if mesh.getSize() > 0:
-                return mesh
-        return None
-
-    def get_output_file_name(self):
-        return self._output_filename
-
-    def _load(self):
-        result = self._region.readFile(self._scaffold_file)
-        assert result == RESULT_OK, "Failed to load model file" + str(self._scaffold_file)
-        self._mesh = [self._field_module.findMeshByDimension(d + 1) for d in range(3)]
-        self._discover_coordinate_fields()
-
-    def _save(self):
-        filename = os.path.basename(self._scaffold_file).split('.')[0] + '_regrouped.exf'
-        path = os.path.dirname(self._scaffold_file)
-        self._output_filename = os.path.join(path, filename)
-        self._region.writeFile(self._output_filename)
-
-    def _manage_groups(self, group_item_list):
-        with ChangeManager(self._field_module):
-            is_exterior = self._field_module.createFieldIsExterior()
-            is_inner = self._field_module.createFieldAnd(is_exterior, self._field_module.createFieldIsOnFace(Element.FACE_TYPE_XI3_0))
-            is_outer = self._field_module.createFieldAnd(is_exterior, self._field_module.createFieldIsOnFace(Element.FACE_TYPE_XI3_1))
-            mesh2d = self._field_module.findMeshByDimension(2)
-            for group_item in group_item_list:
-                print(group_item)
-                group = group_item.split(',')[0]
-                surfaces = group_item.split(',')[1:]
-                term_group = self._field_module.findFieldByName(group).castGroup()
-                #term_group.setSubelementHandlingMode(FieldGroup.SUBELEMENT_HANDLING_MODE_FULL)
-                term_face_group = term_group.getFieldElementGroup(mesh2d)
-                if not term_face_group.isValid():
-                    print('Warning: Did not find face group', group)
-                    continue
-                term_mesh_group = term_face_group.getMeshGroup()
-                surface_condition = None
-                for surface in surfaces:
-                    surface = surface.strip()
-                    if surface == 'inner':
-                        surface_condition = is_inner
-                    elif surface == 'outer':
-                        surface_condition = self._field_module.createFieldOr(surface_condition, is_outer) if (surface_condition) else is_outer
-                    else:
-                        raise KeyError("Surface {} is not valid".format(surface))
-                if surface_condition:
-                    term_mesh_group.removeElementsConditional(self._field_module.createFieldNot(surface_condition))
-                else:
-                    print('Warning: No surface condition for group', group)
-                del surface_condition
-            del is_exterior
-            del is_inner
-            del is_outer
-
-    def _set_model_coordinates_field(self, model_coordinates_field: Field):
-        finite_element_field = model_coordinates_field.castFiniteElement()
-        assert finite_element_field.isValid() and (finite_element_field.getNumberOfComponents() == 3)
-        self._model_coordinates_field = finite_element_field
+from mapclientplugins.scaffoldgroupmanagerstep import __version__
+from mapclientplugins.scaffoldgroupmanagerstep.cache import OutputCache, compute_key, DEFAULT_CACHE_SIZE_LIMIT
+from mapclientplugins.scaffoldgroupmanagerstep.configuration import get_groups_errors, read_groups_config, \
+    validate_config
+from mapclientplugins.scaffoldgroupmanagerstep.incremental import STATE_FILE_NAME
+from mapclientplugins.scaffoldgroupmanagerstep.inputfile import MappedInputFile
+from mapclientplugins.scaffoldgroupmanagerstep.output import OUTPUT_FORMAT_EX, make_output_description, \
+    read_output_buffer
+from mapclientplugins.scaffoldgroupmanagerstep.scaffoldgroupmanager import ScaffoldGroupManager
 
 
 class ScaffoldGroupManagerStep(WorkflowStepMountPoint):
@@ -133,6 +28,9 @@ class ScaffoldGroupManagerStep(WorkflowStepMountPoint):
         self._configured = False  # A step cannot be executed until it has been configured.
         self._category = 'Utility'
         # Add any other initialisation code here:
+        # Qt and the resource bundle are only imported once the step is built, keeping the engine headless.
+        from PySide6 import QtGui
+        from mapclientplugins.scaffoldgroupmanagerstep import resources_rc  # noqa: F401
         self._icon = QtGui.QImage(':/scaffoldgroupmanagerstep/images/utility.png')
         # Ports:
         self.addPort(('http://physiomeproject.org/workflow/1.0/rdf-schema#port',
@@ -141,14 +39,39 @@ class ScaffoldGroupManagerStep(WorkflowStepMountPoint):
         self.addPort(('http://physiomeproject.org/workflow/1.0/rdf-schema#port',
                       'http://physiomeproject.org/workflow/1.0/rdf-schema#provides',
                       'http://physiomeproject.org/workflow/1.0/rdf-schema#file_location'))
+        self.addPort(('http://physiomeproject.org/workflow/1.0/rdf-schema#port',
+                      'http://physiomeproject.org/workflow/1.0/rdf-schema#provides',
+                      'http://physiomeproject.org/workflow/1.0/rdf-schema#scaffold_output_description'))
+        self.addPort(('http://physiomeproject.org/workflow/1.0/rdf-schema#port',
+                      'http://physiomeproject.org/workflow/1.0/rdf-schema#provides',
+                      'http://physiomeproject.org/workflow/1.0/rdf-schema#zinc_ex_memory_buffer'))
         # Port data:
         self._port0_input_file = None  # http://physiomeproject.org/workflow/1.0/rdf-schema#file_location
         self._port1_output_file = None  # http://physiomeproject.org/workflow/1.0/rdf-schema#file_location
+        self._port2_output_description = None  # http://physiomeproject.org/workflow/1.0/rdf-schema#scaffold_output_description
+        self._port3_output_buffer = None  # http://physiomeproject.org/workflow/1.0/rdf-schema#zinc_ex_memory_buffer
         # Config:
         self._config = {}
         self._config['identifier'] = ''
+        self._config['cache_enabled'] = True
+        self._config['cache_size_limit'] = DEFAULT_CACHE_SIZE_LIMIT
+        self._config['classify_faces'] = True
+        self._config['output_format'] = OUTPUT_FORMAT_EX
+        self._config['binary_sidecar'] = False
+        self._config['lazy_load'] = False
+        self._config['write_report'] = True
+        self._config['profile'] = False
+        self._config['memory_output'] = False
+        self._config['coordinates_field_name'] = ''
+        self._config['preflight'] = True
+        self._config['memory_budget_mb'] = 0
+        self._config['incremental'] = True
+        self._config['rebuild_subelements'] = False
         self._scaffold_group_manager = None
+        self._scaffold_group_manager_key = None
         self._groups = {}
+        self._worker = None
+        self._progress_dialog = None
 
     def execute(self):
         """
@@ -158,15 +81,143 @@ class ScaffoldGroupManagerStep(WorkflowStepMountPoint):
         """
         # Put your execute step code here before calling the '_doneExecution' method.
 
-        if len(self._groups) == 0 and os.path.isfile(os.path.join(self._location, 'groups.config')):
-            with open(os.path.join(self._location, 'groups.config'), "r") as f:
-                saved_settings = json.loads(f.read())
+        if len(self._groups) == 0:
+            saved_settings = read_groups_config(self._location)
+            if saved_settings:
                 self._groups.update(saved_settings)
 
-        self._scaffold_group_manager = ScaffoldGroupManager(self._port0_input_file, self._groups)
-        self._port1_output_file = self._scaffold_group_manager.get_output_file_name()
+        # Keep the loaded region between executions unless the input or settings change.  A lazily
+        # loaded region only holds the groups of its rules, so it is also reloaded when the rules change.
+        manager_options = self._get_manager_options()
+        manager_key = (manager_options, list(self._groups.get("groups", [])) if self._config['lazy_load'] else None)
+        if (self._scaffold_group_manager is None) or (manager_key != self._scaffold_group_manager_key) or \
+                not self._scaffold_group_manager.is_loaded_from(self._port0_input_file):
+            self._scaffold_group_manager = ScaffoldGroupManager(self._port0_input_file, self._groups, **manager_options)
+            self._scaffold_group_manager_key = manager_key
+
+        # Hash, load, regroup and save on a worker thread so the GUI stays responsive and the run can be cancelled.
+        from PySide6 import QtCore, QtWidgets
+        from mapclientplugins.scaffoldgroupmanagerstep.worker import RegroupWorker
+
+        self._progress_dialog = QtWidgets.QProgressDialog('Regrouping scaffold', 'Cancel', 0, 100, self._main_window)
+        self._progress_dialog.setWindowTitle('Scaffold Group Manager')
+        self._progress_dialog.setWindowModality(QtCore.Qt.WindowModal)
+        self._progress_dialog.setMinimumDuration(500)
+        self._progress_dialog.canceled.connect(self._scaffold_group_manager.cancel)
+        self._worker = RegroupWorker(self._run_pipeline, self._show_progress, self._pipeline_finished)
+        self._worker.start()
+
+    def _run_pipeline(self, progress):
+        """
+        Return the cached outputs, or regroup the scaffold with the current manager
+        and cache its outputs. Runs on the worker thread.
+
+        :return: Tuple of the output file, output description and output buffer.
+        """
+        use_cache = self._config['cache_enabled'] and self._location
+        # Map the input once when the cache key or the preflight scan will read it, sharing the mapping.
+        use_input_file = use_cache or self._config['preflight'] or self._config['memory_budget_mb']
+        with MappedInputFile(self._port0_input_file) if use_input_file else nullcontext() as input_file:
+            cache = None
+            cache_key = None
+            if use_cache:
+                progress('hash_input', 0, 1, '')
+                cache = OutputCache(os.path.join(self._location, 'cache'), self._config['cache_size_limit'])
+                cache_key = compute_key(self._port0_input_file, self._groups, __version__, options={
+                    'output_format': self._config['output_format'],
+                    'binary_sidecar': self._config['binary_sidecar'],
+                    'coordinates_field_name': self._config['coordinates_field_name'],
+                    'rebuild_subelements': self._config['rebuild_subelements'],
+                }, input_file=input_file)
+                cached_output_files = cache.lookup(cache_key)
+                if cached_output_files:
+                    output_file = cached_output_files['file']
+                    output_description = make_output_description(
+                        self._config['output_format'], output_file,
+                        cached_output_files.get('sidecar'), cached_output_files.get('manifest'))
+                    output_buffer = read_output_buffer(output_file, self._config['output_format']) \
+                        if self._config['memory_output'] else None
+                    return output_file, output_description, output_buffer
+
+            manager = self._scaffold_group_manager
+            manager.set_input_file(input_file)
+            manager.set_progress_callback(progress)
+            try:
+                manager.apply(self._groups.get("groups", []))
+                manager.save()
+            finally:
+                manager.set_progress_callback(None)
+                manager.set_input_file(None)
+
+        output_description = manager.get_output_description()
+        if self._config['write_report'] and self._location:
+            manager.get_report().write(os.path.join(self._location, 'regroup_report.json'))
+        if cache:
+            output_files = {role: output_description[role] for role in ('file', 'sidecar', 'manifest')
+                            if output_description[role]}
+            cache.store(cache_key, output_files)
+        return manager.get_output_file_name(), output_description, manager.get_output_buffer()
+
+    # Share of the progress bar at the start of each phase.
+    _PHASE_PROGRESS = {
+        'hash_input': (0, 0),
+        'preflight': (0, 5),
+        'load': (5, 40),
+        'classify_faces': (40, 50),
+        'chunk': (5, 90),
+        'manage_groups': (50, 85),
+        'rebuild_subelements': (85, 90),
+        'save': (90, 100),
+    }
+
+    def _show_progress(self, phase, done, total, detail):
+        if self._progress_dialog is None:
+            return
+        start, end = self._PHASE_PROGRESS.get(phase, (0, 100))
+        self._progress_dialog.setValue(start + (end - start) * done // max(total, 1))
+        self._progress_dialog.setLabelText('{0} {1}'.format(phase.replace('_', ' ').capitalize(), detail).strip())
+
+    def _pipeline_finished(self, outputs, error):
+        """
+        Publish the results of the worker thread. Runs on the GUI thread.
+        On an error or cancel the step does not finish, stopping the workflow.
+        """
+        # Closing the dialog emits canceled, which must not reach the next run.
+        self._progress_dialog.canceled.disconnect(self._scaffold_group_manager.cancel)
+        self._progress_dialog.close()
+        self._progress_dialog = None
+        self._worker = None
+        if error is not None:
+            from PySide6 import QtWidgets
+            from mapclientplugins.scaffoldgroupmanagerstep.scaffoldgroupmanager import RegroupCancelled
+
+            self._port1_output_file = None
+            self._port2_output_description = None
+            self._port3_output_buffer = None
+            if isinstance(error, RegroupCancelled):
+                print(error)
+            else:
+                QtWidgets.QMessageBox.warning(self._main_window, 'Scaffold Group Manager', str(error))
+            return
+        self._port1_output_file, self._port2_output_description, self._port3_output_buffer = outputs
         self._doneExecution()
 
+    def _get_manager_options(self):
+        return {
+            'classify_faces': self._config['classify_faces'],
+            'output_format': self._config['output_format'],
+            'binary_sidecar': self._config['binary_sidecar'],
+            'lazy_load': self._config['lazy_load'],
+            'profile': self._config['profile'],
+            'memory_output': self._config['memory_output'],
+            'coordinates_field_name': self._config['coordinates_field_name'] or None,
+            'run_preflight': self._config['preflight'],
+            'memory_budget': self._config['memory_budget_mb'] * 1024 ** 2,
+            'rebuild_subelements': self._config['rebuild_subelements'],
+            'state_file': os.path.join(self._location, STATE_FILE_NAME)
+            if (self._config['incremental'] and self._location) else None,
+        }
+
     def setPortData(self, index, dataIn):
         """
         Add your code here that will set the appropriate objects for this step.
@@ -186,6 +237,10 @@ class ScaffoldGroupManagerStep(WorkflowStepMountPoint):
 
         :param index: Index of the port to return.
         """
+        if index == 2:
+            return self._port2_output_description
+        if index == 3:
+            return self._port3_output_buffer
         return self._port1_output_file  # <not-set>
 
     def configure(self):
@@ -197,6 +252,8 @@ class ScaffoldGroupManagerStep(WorkflowStepMountPoint):
             self._configured = True
         """
 
+        from mapclientplugins.scaffoldgroupmanagerstep.configuredialog import ConfigureDialog
+
         dlg = ConfigureDialog(self._location, self._main_window)
         dlg.identifierOccursCount = self._identifierOccursCount
         dlg.setConfig(self._config)
@@ -204,12 +261,14 @@ class ScaffoldGroupManagerStep(WorkflowStepMountPoint):
         dlg.setModal(True)
 
         if dlg.exec_():
-            self._config = dlg.getConfig()
+            self._config.update(dlg.getConfig())
 
-        self._configured = dlg.validate()
-        self._configuredObserver()
         self._groups = dlg.getGroups()
         dlg.saveConfig()
+        # Check the settings and groups as a saved workflow is checked when loaded.
+        self._configured = validate_config(self._config, self._identifierOccursCount, self._location) and \
+            not get_groups_errors(self._groups)
+        self._configuredObserver()
 
     def getIdentifier(self):
         """
@@ -238,8 +297,4 @@ class ScaffoldGroupManagerStep(WorkflowStepMountPoint):
         :param string: JSON representation of the configuration in a string.
         """
         self._config.update(json.loads(string))
-
-        d = ConfigureDialog()
-        d.identifierOccursCount = self._identifierOccursCount
-        d.setConfig(self._config)
-        self._configured = d.validate()
+        self._configured = validate_config(self._config, self._identifierOccursCount, self._location)
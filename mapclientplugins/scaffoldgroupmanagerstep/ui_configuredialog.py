@@ -15,23 +15,129 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QAbstractButton, QApplication, QDialog, QDialogButtonBox,
-    QGridLayout, QGroupBox, QLabel, QLineEdit,
-    QPushButton, QSizePolicy, QSpacerItem, QWidget)
+from PySide6.QtWidgets import (QAbstractButton, QApplication, QCheckBox, QComboBox,
+    QDialog, QDialogButtonBox, QGridLayout, QGroupBox,
+    QLabel, QLineEdit, QPushButton, QSizePolicy,
+    QSpacerItem, QSpinBox, QWidget)
 
 class Ui_ConfigureDialog(object):
     def setupUi(self, ConfigureDialog):
         if not ConfigureDialog.objectName():
             ConfigureDialog.setObjectName(u"ConfigureDialog")
-        ConfigureDialog.resize(597, 336)
+        ConfigureDialog.resize(597, 700)
         self.gridLayout = QGridLayout(ConfigureDialog)
         self.gridLayout.setObjectName(u"gridLayout")
+        self.settingsGroupBox = QGroupBox(ConfigureDialog)
+        self.settingsGroupBox.setObjectName(u"settingsGroupBox")
+        self.settingsGridLayout = QGridLayout(self.settingsGroupBox)
+        self.settingsGridLayout.setObjectName(u"settingsGridLayout")
+        self.outputFormatLabel = QLabel(self.settingsGroupBox)
+        self.outputFormatLabel.setObjectName(u"outputFormatLabel")
+
+        self.settingsGridLayout.addWidget(self.outputFormatLabel, 0, 0, 1, 1)
+
+        self.outputFormatComboBox = QComboBox(self.settingsGroupBox)
+        self.outputFormatComboBox.setObjectName(u"outputFormatComboBox")
+
+        self.settingsGridLayout.addWidget(self.outputFormatComboBox, 0, 1, 1, 1)
+
+        self.binarySidecarCheckBox = QCheckBox(self.settingsGroupBox)
+        self.binarySidecarCheckBox.setObjectName(u"binarySidecarCheckBox")
+
+        self.settingsGridLayout.addWidget(self.binarySidecarCheckBox, 1, 0, 1, 2)
+
+        self.memoryOutputCheckBox = QCheckBox(self.settingsGroupBox)
+        self.memoryOutputCheckBox.setObjectName(u"memoryOutputCheckBox")
+
+        self.settingsGridLayout.addWidget(self.memoryOutputCheckBox, 2, 0, 1, 2)
+
+        self.lazyLoadCheckBox = QCheckBox(self.settingsGroupBox)
+        self.lazyLoadCheckBox.setObjectName(u"lazyLoadCheckBox")
+
+        self.settingsGridLayout.addWidget(self.lazyLoadCheckBox, 3, 0, 1, 2)
+
+        self.coordinatesFieldLabel = QLabel(self.settingsGroupBox)
+        self.coordinatesFieldLabel.setObjectName(u"coordinatesFieldLabel")
+
+        self.settingsGridLayout.addWidget(self.coordinatesFieldLabel, 4, 0, 1, 1)
+
+        self.coordinatesFieldLineEdit = QLineEdit(self.settingsGroupBox)
+        self.coordinatesFieldLineEdit.setObjectName(u"coordinatesFieldLineEdit")
+
+        self.settingsGridLayout.addWidget(self.coordinatesFieldLineEdit, 4, 1, 1, 1)
+
+        self.classifyFacesCheckBox = QCheckBox(self.settingsGroupBox)
+        self.classifyFacesCheckBox.setObjectName(u"classifyFacesCheckBox")
+
+        self.settingsGridLayout.addWidget(self.classifyFacesCheckBox, 5, 0, 1, 2)
+
+        self.rebuildSubelementsCheckBox = QCheckBox(self.settingsGroupBox)
+        self.rebuildSubelementsCheckBox.setObjectName(u"rebuildSubelementsCheckBox")
+
+        self.settingsGridLayout.addWidget(self.rebuildSubelementsCheckBox, 6, 0, 1, 2)
+
+        self.preflightCheckBox = QCheckBox(self.settingsGroupBox)
+        self.preflightCheckBox.setObjectName(u"preflightCheckBox")
+
+        self.settingsGridLayout.addWidget(self.preflightCheckBox, 7, 0, 1, 2)
+
+        self.incrementalCheckBox = QCheckBox(self.settingsGroupBox)
+        self.incrementalCheckBox.setObjectName(u"incrementalCheckBox")
+
+        self.settingsGridLayout.addWidget(self.incrementalCheckBox, 8, 0, 1, 2)
+
+        self.memoryBudgetLabel = QLabel(self.settingsGroupBox)
+        self.memoryBudgetLabel.setObjectName(u"memoryBudgetLabel")
+
+        self.settingsGridLayout.addWidget(self.memoryBudgetLabel, 9, 0, 1, 1)
+
+        self.memoryBudgetSpinBox = QSpinBox(self.settingsGroupBox)
+        self.memoryBudgetSpinBox.setObjectName(u"memoryBudgetSpinBox")
+        self.memoryBudgetSpinBox.setMaximum(1048576)
+
+        self.settingsGridLayout.addWidget(self.memoryBudgetSpinBox, 9, 1, 1, 1)
+
+        self.cacheEnabledCheckBox = QCheckBox(self.settingsGroupBox)
+        self.cacheEnabledCheckBox.setObjectName(u"cacheEnabledCheckBox")
+
+        self.settingsGridLayout.addWidget(self.cacheEnabledCheckBox, 10, 0, 1, 2)
+
+        self.cacheSizeLimitLabel = QLabel(self.settingsGroupBox)
+        self.cacheSizeLimitLabel.setObjectName(u"cacheSizeLimitLabel")
+
+        self.settingsGridLayout.addWidget(self.cacheSizeLimitLabel, 11, 0, 1, 1)
+
+        self.cacheSizeLimitSpinBox = QSpinBox(self.settingsGroupBox)
+        self.cacheSizeLimitSpinBox.setObjectName(u"cacheSizeLimitSpinBox")
+        self.cacheSizeLimitSpinBox.setMaximum(1048576)
+
+        self.settingsGridLayout.addWidget(self.cacheSizeLimitSpinBox, 11, 1, 1, 1)
+
+        self.writeReportCheckBox = QCheckBox(self.settingsGroupBox)
+        self.writeReportCheckBox.setObjectName(u"writeReportCheckBox")
+
+        self.settingsGridLayout.addWidget(self.writeReportCheckBox, 12, 0, 1, 2)
+
+        self.profileCheckBox = QCheckBox(self.settingsGroupBox)
+        self.profileCheckBox.setObjectName(u"profileCheckBox")
+
+        self.settingsGridLayout.addWidget(self.profileCheckBox, 13, 0, 1, 2)
+
+        self.settingsErrorsLabel = QLabel(self.settingsGroupBox)
+        self.settingsErrorsLabel.setObjectName(u"settingsErrorsLabel")
+        self.settingsErrorsLabel.setWordWrap(True)
+
+        self.settingsGridLayout.addWidget(self.settingsErrorsLabel, 14, 0, 1, 2)
+
+
+        self.gridLayout.addWidget(self.settingsGroupBox, 2, 0, 1, 1)
+
         self.buttonBox = QDialogButtonBox(ConfigureDialog)
         self.buttonBox.setObjectName(u"buttonBox")
         self.buttonBox.setOrientation(Qt.Horizontal)
         self.buttonBox.setStandardButtons(QDialogButtonBox.Cancel|QDialogButtonBox.Ok)
 
-        self.gridLayout.addWidget(self.buttonBox, 2, 0, 1, 1)
+        self.gridLayout.addWidget(self.buttonBox, 3, 0, 1, 1)
 
         self.configGroupBox = QGroupBox(ConfigureDialog)
         self.configGroupBox.setObjectName(u"configGroupBox")
@@ -118,6 +224,29 @@ class Ui_ConfigureDialog(object):
 
     def retranslateUi(self, ConfigureDialog):
         ConfigureDialog.setWindowTitle(QCoreApplication.translate("ConfigureDialog", u"Configure Step", None))
+        self.settingsGroupBox.setTitle(QCoreApplication.translate("ConfigureDialog", u"Settings", None))
+        self.outputFormatLabel.setText(QCoreApplication.translate("ConfigureDialog", u"Output format:", None))
+        self.binarySidecarCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Write a binary sidecar of the coordinates and group membership", None))
+        self.memoryOutputCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Also output the regrouped scaffold as an in-memory EX buffer", None))
+        self.lazyLoadCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Lazy load: read only the fields the rules need (groups delta output only)", None))
+        self.coordinatesFieldLabel.setText(QCoreApplication.translate("ConfigureDialog", u"Coordinates field:", None))
+        self.coordinatesFieldLineEdit.setPlaceholderText(QCoreApplication.translate("ConfigureDialog", u"Found by search", None))
+        self.classifyFacesCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Classify faces once for all rules", None))
+        self.rebuildSubelementsCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Trim the lines and nodes of trimmed face groups", None))
+        self.preflightCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Check the rules against the file headers before loading", None))
+        self.incrementalCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Reuse the results of unchanged rules from the last run", None))
+        self.memoryBudgetLabel.setText(QCoreApplication.translate("ConfigureDialog", u"Memory budget:", None))
+#if QT_CONFIG(tooltip)
+        self.memoryBudgetSpinBox.setToolTip(QCoreApplication.translate("ConfigureDialog", u"Regroup in chunks estimated to fit this budget. Each chunk reads the whole mesh again; an estimate, not a limit on memory.", None))
+#endif // QT_CONFIG(tooltip)
+        self.memoryBudgetSpinBox.setSpecialValueText(QCoreApplication.translate("ConfigureDialog", u"Off", None))
+        self.memoryBudgetSpinBox.setSuffix(QCoreApplication.translate("ConfigureDialog", u" MB", None))
+        self.cacheEnabledCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Cache outputs for unchanged inputs and rules", None))
+        self.cacheSizeLimitLabel.setText(QCoreApplication.translate("ConfigureDialog", u"Cache size limit:", None))
+        self.cacheSizeLimitSpinBox.setSuffix(QCoreApplication.translate("ConfigureDialog", u" MB", None))
+        self.writeReportCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Write a regroup report", None))
+        self.profileCheckBox.setText(QCoreApplication.translate("ConfigureDialog", u"Profile each phase in the report", None))
+        self.settingsErrorsLabel.setText("")
         self.configGroupBox.setTitle("")
         self.label_5.setText(QCoreApplication.translate("ConfigureDialog", u"None", None))
         self.label0.setText(QCoreApplication.translate("ConfigureDialog", u"identifier:  ", None))
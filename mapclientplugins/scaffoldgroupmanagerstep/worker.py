@@ -0,0 +1,63 @@
+"""
+Runs the regroup pipeline on a worker thread, reporting back on the GUI thread.
+"""
+import threading
+import traceback
+
+from PySide6 import QtCore
+
+from mapclientplugins.scaffoldgroupmanagerstep.scaffoldgroupmanager import RegroupCancelled
+
+
+class RegroupWorker(QtCore.QObject):
+    """
+    Calls run(progress) on a worker thread. The progress and finished callbacks
+    are called on the thread the worker was created on, through queued signals,
+    so they may update widgets.
+
+    :param run: Function of a progress function (phase, done, total, detail),
+    returning the result.
+    :param on_progress: Function of (phase, done, total, detail).
+    :param on_finished: Function of (result, error), error being None on success,
+    a RegroupCancelled if cancelled, or the exception raised by run.
+    """
+
+    _progress = QtCore.Signal(str, int, int, str)
+    _finished = QtCore.Signal(object, object)
+
+    def __init__(self, run, on_progress, on_finished, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self._run = run
+        self._on_progress = on_progress
+        self._on_finished = on_finished
+        self._thread = None
+        self._progress.connect(self._report_progress, QtCore.Qt.QueuedConnection)
+        self._finished.connect(self._finish, QtCore.Qt.QueuedConnection)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._execute, name='ScaffoldRegroup', daemon=True)
+        self._thread.start()
+
+    def is_running(self):
+        return (self._thread is not None) and self._thread.is_alive()
+
+    def _execute(self):
+        result = None
+        error = None
+        try:
+            result = self._run(self._progress.emit)
+        except RegroupCancelled as e:
+            error = e
+        except Exception as e:
+            traceback.print_exc()
+            error = e
+        self._finished.emit(result, error)
+
+    @QtCore.Slot(str, int, int, str)
+    def _report_progress(self, phase, done, total, detail):
+        self._on_progress(phase, done, total, detail)
+
+    @QtCore.Slot(object, object)
+    def _finish(self, result, error):
+        self._thread.join()
+        self._on_finished(result, error)
@@ -23,7 +23,8 @@ requires = [
     # minimal requirements listing
     "opencmiss.utils >= 0.3",
     "opencmiss.zinc >= 3.2",  # not yet on pypi - need manual install from opencmiss.org
-    "opencmiss.zincwidgets >= 2.0"
+    "opencmiss.zincwidgets >= 2.0",
+    "numpy"
 ]
 source_license = readfile("LICENSE")
 
@@ -58,4 +59,10 @@ setup(
     include_package_data=True,
     zip_safe=False,
     install_requires=requires,
+    entry_points={
+        'console_scripts': [
+            'scaffold-regroup = mapclientplugins.scaffoldgroupmanagerstep.cli:main',
+            'scaffold-merge-shards = mapclientplugins.scaffoldgroupmanagerstep.sharded:main',
+        ],
+    },
 )
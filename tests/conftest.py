@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from synthetic import write_tube_scaffold  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def tube_scaffold(tmp_path_factory):
+    """
+    Small synthetic scaffold of 16 hexahedra in 4 term groups, with its groups config.
+    """
+    file_name = str(tmp_path_factory.mktemp('scaffold') / 'tube.exf')
+    groups = write_tube_scaffold(file_name, 8, 2, 1, 4)
+    return file_name, groups
@@ -0,0 +1,66 @@
+import os
+
+from mapclientplugins.scaffoldgroupmanagerstep.cache import OutputCache, compute_key, normalise_groups
+
+
+def write_output(directory, name, size):
+    file_name = os.path.join(str(directory), name)
+    with open(file_name, 'wb') as f:
+        f.write(b'x' * size)
+    return file_name
+
+
+def test_normalise_groups():
+    assert normalise_groups({'groups': [' LV ,inner', '', '"a, b" , outer']}) == ['LV,inner', '"a, b",outer']
+    assert normalise_groups(None) == []
+
+
+def test_compute_key(tmp_path):
+    file_name = write_output(tmp_path, 'input.exf', 10)
+    key = compute_key(file_name, {'groups': ['LV, inner']}, '0.1.0')
+    assert key == compute_key(file_name, {'groups': ['LV,inner', '']}, '0.1.0')
+    assert key != compute_key(file_name, {'groups': ['LV, outer']}, '0.1.0')
+    assert key != compute_key(file_name, {'groups': ['LV, inner']}, '0.2.0')
+    assert key != compute_key(file_name, {'groups': ['LV, inner']}, '0.1.0', {'output_format': 'exf.gz'})
+
+
+def test_lookup_returns_originals_until_changed(tmp_path):
+    cache = OutputCache(str(tmp_path / 'cache'))
+    output_file = write_output(tmp_path, 'out.exf', 10)
+    assert cache.lookup('a') is None
+    cached = cache.store('a', {'output': output_file})
+    assert os.path.isfile(cached['output'])
+    assert cache.lookup('a') == {'output': os.path.abspath(output_file)}
+    write_output(tmp_path, 'out.exf', 11)
+    assert cache.lookup('a') == cached
+    # The index persists between sessions.
+    assert OutputCache(str(tmp_path / 'cache')).lookup('a') == cached
+    os.remove(cached['output'])
+    assert cache.lookup('a') is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = OutputCache(str(tmp_path / 'cache'), size_limit=25)
+    cached = {}
+    for key in 'abc':
+        cached[key] = cache.store(key, {'output': write_output(tmp_path, key + '.exf', 10)})
+    # Storing c exceeded the limit, evicting a.
+    assert cache.lookup('a') is None
+    assert not os.path.exists(cached['a']['output'])
+    assert cache.size() == 20
+    cache.lookup('b')
+    cache.store('d', {'output': write_output(tmp_path, 'd.exf', 10)})
+    assert cache.lookup('c') is None
+    assert cache.lookup('b') is not None
+    assert cache.lookup('d') is not None
+
+
+def test_keeps_newest_entry_over_limit(tmp_path):
+    cache = OutputCache(str(tmp_path / 'cache'), size_limit=5)
+    cache.store('a', {'output': write_output(tmp_path, 'a.exf', 10)})
+    cache.store('b', {'output': write_output(tmp_path, 'b.exf', 10)})
+    assert cache.lookup('a') is None
+    assert cache.lookup('b') is not None
+    cache.clear()
+    assert cache.size() == 0
+    assert not os.path.exists(str(tmp_path / 'cache' / 'b'))
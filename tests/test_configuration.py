@@ -0,0 +1,21 @@
+from mapclientplugins.scaffoldgroupmanagerstep.configuration import STEP_OUTPUT_FORMATS, get_config_errors, \
+    get_groups_errors
+
+
+def test_get_config_errors():
+    assert get_config_errors({'output_format': 'exf', 'memory_budget_mb': 0, 'cache_size_limit': 1024}) == []
+    assert len(get_config_errors({'output_format': 'stl'})) == 1
+    assert len(get_config_errors({'output_format': 'exf', 'lazy_load': True})) == 1
+    assert len(get_config_errors({'output_format': 'groups.exf', 'memory_budget_mb': 100})) == 1
+    assert len(get_config_errors({'output_format': 'exf', 'memory_budget_mb': -1})) == 1
+
+
+def test_sharded_output_is_command_line_only():
+    assert 'shards.json' not in STEP_OUTPUT_FORMATS
+    assert len(get_config_errors({'output_format': 'shards.json'})) == 1
+
+
+def test_get_groups_errors():
+    assert get_groups_errors({'groups': ['LV, inner', '', 'RV, dim=1, xi1_0 or in "septum"']}) == []
+    assert len(get_groups_errors({'groups': ['LV, middle', 'RV, (inner', 3, ', inner']})) == 4
+    assert get_groups_errors([]) == ['Groups config must be a dictionary']
@@ -0,0 +1,63 @@
+import gzip
+
+from mapclientplugins.scaffoldgroupmanagerstep.output import rewrite_group_membership
+from mapclientplugins.scaffoldgroupmanagerstep.preflight import open_text, parse_identifier_ranges, scan_header
+
+
+def read_group_members(file_name):
+    """
+    Read the root region group members of an EX file by (group name, dimension).
+    """
+    members = {}
+    key = None
+    group_name = None
+    dimension = 0
+    with open_text(file_name) as f:
+        for line in f:
+            if key and line[:1].isdigit():
+                members[key].extend(parse_identifier_ranges(line))
+                continue
+            key = None
+            if line.startswith('Group name:'):
+                group_name = line.split(':', 1)[1].strip()
+            elif line.startswith('!#nodeset'):
+                dimension = 0
+            elif line.startswith('!#mesh'):
+                dimension = int(line.split('dimension=', 1)[1].split(',')[0])
+            elif group_name and (line.startswith('Node group:') or line.startswith('Element group:')):
+                key = (group_name, dimension)
+                members[key] = []
+    return members
+
+
+def test_rewrite_group_membership(tube_scaffold, tmp_path):
+    file_name, _ = tube_scaffold
+    members = read_group_members(file_name)
+    removed = {
+        ('term 1', 2): members[('term 1', 2)][:5],
+        ('term 2', 0): members[('term 2', 0)][1:-1],
+        ('term 3', 1): [],
+    }
+    output_file = str(tmp_path / 'rewritten.exf')
+    rewrite_group_membership(file_name, output_file, removed)
+    rewritten = read_group_members(output_file)
+    assert rewritten[('term 1', 2)] == members[('term 1', 2)][5:]
+    assert rewritten[('term 2', 0)] == [members[('term 2', 0)][0], members[('term 2', 0)][-1]]
+    for key in members:
+        if key not in removed or not removed[key]:
+            assert rewritten[key] == members[key]
+    header = scan_header(output_file)
+    assert header.node_count == 48
+    assert header.element_counts == {1: 104, 2: 72, 3: 16}
+
+
+def test_rewrite_group_membership_drops_empty_groups(tube_scaffold, tmp_path):
+    file_name, _ = tube_scaffold
+    members = read_group_members(file_name)
+    output_file = str(tmp_path / 'rewritten.exf.gz')
+    rewrite_group_membership(file_name, output_file, {('term 4', 2): members[('term 4', 2)]})
+    with gzip.open(output_file, 'rt') as f:
+        f.read(1)
+    rewritten = read_group_members(output_file)
+    assert ('term 4', 2) not in rewritten
+    assert rewritten[('term 4', 3)] == members[('term 4', 3)]
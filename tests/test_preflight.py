@@ -0,0 +1,109 @@
+import gzip
+import shutil
+
+import pytest
+
+from mapclientplugins.scaffoldgroupmanagerstep.inputfile import MappedInputFile
+from mapclientplugins.scaffoldgroupmanagerstep.preflight import count_identifier_ranges, \
+    format_identifier_ranges, parse_identifier_ranges, preflight, scan_header
+
+LEGACY_EX = """\
+ Group name: wall
+ #Fields=1
+ 1) coordinates, coordinate, rectangular cartesian, #Components=3
+ Node:            1
+ Node:            2
+ Node:            3
+ Shape.  Dimension=3, line*line*line
+ Element:            1 0 0
+ Element:            2 0 0
+ Group name: cap
+ Node:            3
+ Node:            4
+ Element:            2 0 0
+"""
+
+
+def test_identifier_ranges():
+    assert parse_identifier_ranges('1..3,7, 9..10') == [1, 2, 3, 7, 9, 10]
+    assert count_identifier_ranges('1..3,7, 9..10') == 6
+    assert format_identifier_ranges([1, 2, 3, 7, 9, 10]) == '1..3,7,9..10'
+    assert format_identifier_ranges([]) == ''
+
+
+def test_scan_header(tube_scaffold):
+    file_name, _ = tube_scaffold
+    header = scan_header(file_name)
+    assert header.version >= 2
+    assert header.field_names == ['coordinates']
+    assert header.group_names == ['term 1', 'term 2', 'term 3', 'term 4']
+    assert header.node_count == 48
+    assert header.element_counts == {1: 104, 2: 72, 3: 16}
+    assert header.group_sizes[('term 1', 3)] == 4
+    assert header.group_sizes[('term 1', 0)] == 18
+
+
+def test_scan_header_gzip(tube_scaffold, tmp_path):
+    file_name, _ = tube_scaffold
+    gz_file_name = str(tmp_path / 'tube.exf.gz')
+    with open(file_name, 'rb') as f, gzip.open(gz_file_name, 'wb') as out:
+        shutil.copyfileobj(f, out)
+    header = scan_header(file_name)
+    gz_header = scan_header(gz_file_name)
+    assert (gz_header.node_count, gz_header.element_counts, gz_header.group_sizes) == \
+        (header.node_count, header.element_counts, header.group_sizes)
+
+
+def get_header_values(header):
+    return header.version, header.field_names, header.group_names, header.node_count, header.element_counts, \
+        header.node_components, header.group_sizes
+
+
+@pytest.mark.parametrize('line_ending', ['\n', '\r\n'])
+def test_scan_header_mapped(tube_scaffold, tmp_path, line_ending):
+    file_name, _ = tube_scaffold
+    copy_file_name = str(tmp_path / 'tube.exf')
+    with open(file_name, 'r') as f, open(copy_file_name, 'w', newline=line_ending) as out:
+        out.write(f.read())
+    with MappedInputFile(copy_file_name) as input_file:
+        assert input_file.is_mapped()
+        mapped_header = scan_header(copy_file_name, input_file)
+    assert get_header_values(mapped_header) == get_header_values(scan_header(copy_file_name))
+
+
+def test_scan_header_mapped_legacy(tmp_path):
+    file_name = str(tmp_path / 'legacy.exnode')
+    with open(file_name, 'w') as f:
+        f.write(LEGACY_EX)
+    with MappedInputFile(file_name) as input_file:
+        mapped_header = scan_header(file_name, input_file)
+    assert get_header_values(mapped_header) == get_header_values(scan_header(file_name))
+
+
+def test_scan_header_legacy(tmp_path):
+    file_name = str(tmp_path / 'legacy.exnode')
+    with open(file_name, 'w') as f:
+        f.write(LEGACY_EX)
+    header = scan_header(file_name)
+    assert header.version is None
+    assert header.group_names == ['wall', 'cap']
+    # Records repeated in several groups are only counted once.
+    assert header.node_count == 4
+    assert header.element_counts[3] == 2
+
+
+def test_preflight(tube_scaffold):
+    file_name, groups = tube_scaffold
+    report = preflight(file_name, groups['groups'], 'coordinates')
+    assert report.succeeded()
+    assert report.estimated_memory > 0
+    assert report.estimated_evaluations > 0
+
+
+def test_preflight_errors(tube_scaffold):
+    file_name, _ = tube_scaffold
+    report = preflight(file_name, ['term 1, inner', 'septum, in "term 2" or in "RV"'], 'geometry')
+    assert len(report.errors) == 3
+    assert not report.succeeded()
+    with pytest.raises(KeyError):
+        preflight(file_name, ['term 1, middle'])
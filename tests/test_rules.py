@@ -0,0 +1,94 @@
+import pytest
+
+from mapclientplugins.scaffoldgroupmanagerstep.rules import ATOM_FLAGS, Atom, InGroup, Not, Or, \
+    compile_rules, parse_rule, parse_selector, split_terms
+
+
+def test_split_terms_keeps_quoted_and_bracketed_commas():
+    assert split_terms('LV, inner') == ['LV', 'inner']
+    assert split_terms('"a, b", in "c, d"') == ['"a, b"', 'in "c, d"']
+    assert split_terms('wall, (xi1_0, xi1_1) and outer') == ['wall', '(xi1_0, xi1_1) and outer']
+    assert split_terms('wall') == ['wall']
+
+
+def test_parse_rule_defaults():
+    rule = parse_rule('LV, inner')
+    assert rule.group_name == 'LV'
+    assert rule.dimension == 2
+    assert rule.region_path == '/'
+    assert isinstance(rule.condition, Atom)
+    assert rule.condition.get_flags() == ATOM_FLAGS['inner']
+    assert rule.text == 'LV, inner'
+
+
+def test_parse_rule_options():
+    rule = parse_rule('septum,dim=1, region= heart//atria/ ,xi1_0')
+    assert rule.dimension == 1
+    assert rule.region_path == '/heart/atria'
+    assert rule.applies_to('/heart/atria')
+    assert not rule.applies_to('/')
+    assert parse_rule('wall, region=*, outer').applies_to('/any/region')
+    assert parse_rule('wall').condition is None
+
+
+def test_parse_rule_ors_selectors():
+    rule = parse_rule('wall, inner, outer')
+    assert isinstance(rule.condition, Or)
+    assert rule.condition.get_flags() == ATOM_FLAGS['inner'] | ATOM_FLAGS['outer']
+
+
+def test_parse_selector_precedence():
+    condition = parse_selector('not inner and outer or xi1_0')
+    assert isinstance(condition, Or)
+    assert sorted(type(child).__name__ for child in condition.children) == ['And', 'Atom']
+    assert isinstance(parse_selector('not inner'), Not)
+    assert parse_selector('not not inner').key == parse_selector('inner').key
+    assert isinstance(parse_selector('in "RV wall"'), InGroup)
+    assert parse_selector("in 'RV wall'").get_group_names() == ['RV wall']
+
+
+def test_equivalent_selectors_share_key():
+    assert parse_selector('inner or outer').key == parse_selector('outer or (inner or outer)').key
+    assert parse_selector('(inner and xi1_0) and outer').key == parse_selector('outer and xi1_0 and inner').key
+    assert parse_selector('(inner)').key == parse_selector('inner').key
+    assert parse_selector('inner or outer').key != parse_selector('inner and outer').key
+
+
+@pytest.mark.parametrize('text', ['', 'inner outer', '(inner', 'inner and', 'in', 'in (inner)', 'inner )', 'inner @'])
+def test_parse_selector_syntax_errors(text):
+    with pytest.raises(ValueError):
+        parse_selector(text)
+
+
+def test_parse_selector_unknown_surface():
+    with pytest.raises(KeyError):
+        parse_selector('middle')
+
+
+@pytest.mark.parametrize('group_item', ['wall, dim=3', 'wall, dim=x', 'wall, dim='])
+def test_parse_rule_dimension_errors(group_item):
+    with pytest.raises(ValueError):
+        parse_rule(group_item)
+
+
+def test_compile_rules_shares_conditions():
+    plan = compile_rules(['a, inner', 'b, inner', '', 'c, dim=1, exterior'])
+    assert [rule.group_name for rule in plan.rules] == ['a', 'b', 'c']
+    assert len(plan.conditions) == 2
+    assert plan.get_flags(2) == ATOM_FLAGS['inner']
+    assert plan.get_flags(1) == ATOM_FLAGS['exterior']
+    assert plan.get_flags(0) == 0
+    assert compile_rules(['a, inner', 'b, inner', '', 'c, dim=1, exterior']) is plan
+
+
+def test_get_rule_sets_joins_rules_sharing_groups():
+    plan = compile_rules(['a, inner', 'b, outer', 'c, in "a"', 'd, dim=1, in "b" or in "e"', 'e, exterior'])
+    rule_sets = [[rule.group_name for rule in rule_set] for rule_set in plan.get_rule_sets()]
+    assert sorted(rule_sets) == [['a', 'c'], ['b', 'd', 'e']]
+    assert plan.get_group_names() == ['a', 'b', 'c', 'd', 'e']
+
+
+def test_get_region_rules():
+    plan = compile_rules(['a, inner', 'b, region=/heart, outer', 'c, region=*, exterior'])
+    assert [rule.group_name for rule in plan.get_region_rules('/')] == ['a', 'c']
+    assert [rule.group_name for rule in plan.get_region_rules('/heart')] == ['b', 'c']
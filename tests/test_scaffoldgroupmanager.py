@@ -0,0 +1,64 @@
+import pytest
+
+from mapclientplugins.scaffoldgroupmanagerstep.scaffoldgroupmanager import ScaffoldGroupManager
+
+
+def test_apply(tube_scaffold):
+    file_name, groups = tube_scaffold
+    manager = ScaffoldGroupManager(file_name, groups)
+    manager.apply()
+    removed_counts = manager.get_removed_counts()
+    assert set(removed_counts) == {'term 1', 'term 2', 'term 3', 'term 4'}
+    assert all(count > 0 for count in removed_counts.values())
+
+
+def test_apply_checks_rules_before_loading(tmp_path):
+    manager = ScaffoldGroupManager(str(tmp_path / 'missing.exf'), {'groups': []}, run_preflight=False)
+    with pytest.raises(ValueError):
+        manager.apply(['term 1, inner and'])
+    with pytest.raises(KeyError):
+        manager.apply(['term 1, middle'])
+
+
+def test_report_is_per_apply(tube_scaffold):
+    file_name, groups = tube_scaffold
+    manager = ScaffoldGroupManager(file_name, groups)
+    manager.apply()
+    first_report = manager.get_report()
+    manager.apply(groups['groups'][:1])
+    report = manager.get_report()
+    assert report is not first_report
+    assert [record['name'] for record in report.phases].count('manage_groups') == 1
+    assert list(report.removed_counts) == ['term 1']
+    # The load is shared with the first apply and still reported.
+    assert report.load_report is first_report.load_report
+    assert report.get_phase_time('load') == first_report.get_phase_time('load') > 0
+    report_dict = report.to_dict()
+    assert report_dict['preflight']['errors'] == []
+    assert file_name in report_dict['files_read']
+
+
+def test_apply_checks_rules_against_headers(tube_scaffold):
+    file_name, groups = tube_scaffold
+    manager = ScaffoldGroupManager(file_name, groups)
+    manager.apply()
+    with pytest.raises(ValueError, match='Group septum'):
+        manager.apply(['septum, inner'])
+    with pytest.raises(ValueError, match='Group RV'):
+        ScaffoldGroupManager(file_name, groups).apply(['term 1, in "RV"'])
+
+
+def test_apply_reuses_state(tube_scaffold, tmp_path):
+    file_name, groups = tube_scaffold
+    state_file = str(tmp_path / 'regroup_state.json')
+    manager = ScaffoldGroupManager(file_name, groups, state_file=state_file)
+    manager.apply()
+    removed_counts = manager.get_removed_counts()
+    assert manager.get_report().reused_groups == []
+    for reused_manager in [manager, ScaffoldGroupManager(file_name, groups, state_file=state_file)]:
+        reused_manager.apply()
+        assert reused_manager.get_report().reused_groups == ['term 1', 'term 2', 'term 3', 'term 4']
+        assert reused_manager.get_removed_counts() == removed_counts
+    # Changed rules are recomputed.
+    manager.apply(['term 1, outer'] + groups['groups'][1:])
+    assert manager.get_report().reused_groups == ['term 2', 'term 3', 'term 4']